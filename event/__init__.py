@@ -1,3 +1,3 @@
-__all__ = ['voevent', 'names', 'caltechdata', 'labels', 'lookup']
+__all__ = ['voevent', 'names', 'caltechdata', 'labels', 'lookup', 'table', 'index', 'journal', 'catalog', 'locking', 'migrate', 'labelstore', 'skymask']
 
 from event import *
@@ -2,7 +2,6 @@ import json
 from os import environ, path
 import datetime
 from event import event
-from dataclasses import asdict
 
 try:
     from datacite import DataCiteRESTClient
@@ -146,8 +145,8 @@ def set_metadata(triggerfile=None, schema='43', description=None):
     # set values
     if triggerfile is not None:   # typical format as found on h23
 #        trigger = labels.readfile(filename=triggerfile)
-        dc = event.create_event(fn=triggerfile)
-        trigger = asdict(dc)
+        dc = event.create_event(fn=triggerfile, lazy=True)
+        trigger = {k: getattr(dc, k) for k in ['trigname', 'ibox', 'bf1_dm'] + required + preferred if hasattr(dc, k)}
         # default values (assuming T2/search beam detection)
         metadata['width'] = 0.262144*trigger['ibox']   # TODO: use cnf?
         if dc.raerr is None:
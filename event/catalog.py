@@ -0,0 +1,190 @@
+import os
+import json
+from pathlib import Path
+import numpy as np
+from event import event, locking
+from event.table import EventTable, _kinds, _fills, _encode_str, _decode_str, _str_array
+
+# Binary catalog of DSAEvents. A catalog is a directory with:
+# - header.json with format version, number of rows, heap size and column dtypes,
+# - one <field>.col file per field with fixed-width little-endian values,
+#   for string fields an (offset, length) pair of int64 into heap.bin,
+# - heap.bin with utf-8 string data (other json values of string fields are stored as table._encode_str text),
+# - null.bits with one packed bit per optional field and row (set for None).
+# Rows are appended by writing past the end of each file and then replacing header.json,
+# so readers only see rows that were completely written.
+# Optional fields added to DSAEvent after a catalog was created (e.g., schema_version) are not stored in it
+# and read as None.
+
+CATALOG_VERSION = 1
+
+_coltypes = {float: '<f8', int: '<i8', bool: '|b1', str: '<i8'}
+
+
+class EventCatalog:
+    """ Memory-mappable, appendable binary catalog of DSAEvents.
+    Numeric columns are returned as read-only memmaps, so statistics over many events only read
+    the pages of the columns they use.
+    """
+
+    def __init__(self, path, create=True):
+        self.path = Path(path)
+        self.types = event.field_types()
+
+        if not (self.path / 'header.json').exists():
+            assert create, f'No catalog found at {self.path}'
+            self.path.mkdir(parents=True, exist_ok=True)
+            self._write_header(0, 0)
+
+        with open(self.path / 'header.json') as fp:
+            self.header = json.load(fp)
+        assert self.header['version'] == CATALOG_VERSION, f"Catalog version {self.header['version']} not supported"
+
+        # catalogs created before a field was added to DSAEvent do not have its column
+        stored = set(name for name, dtype in self.header['columns'])
+        self.missing = [(name, base) for name, base, optional in self.types if name not in stored]
+        assert all(optional for name, base, optional in self.types if name not in stored), \
+            "Catalog is missing required DSAEvent fields"
+        self.types = [(name, base, optional) for name, base, optional in self.types if name in stored]
+        assert self.header['columns'] == [[name, _coltypes[base]] for name, base, optional in self.types], \
+            "Catalog columns do not match DSAEvent fields"
+        self.optional = [name for name, base, optional in self.types if optional]
+        self.nbytes = (len(self.optional) + 7)//8
+
+    def _write_header(self, nrows, heapsize):
+        header = {'version': CATALOG_VERSION, 'nrows': nrows, 'heapsize': heapsize,
+                  'columns': [[name, _coltypes[base]] for name, base, optional in self.types]}
+        tmp = self.path / 'header.json.tmp'
+        with open(tmp, 'w') as fp:
+            json.dump(header, fp)
+        os.replace(tmp, self.path / 'header.json')
+        self.header = header
+
+    def __len__(self):
+        return self.header['nrows']
+
+    def _memmap(self, fn, dtype, shape):
+        if not shape[0]:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(self.path / fn, dtype=dtype, mode='r', shape=shape)
+
+    def _append_file(self, fn, data, offset):
+        """ Write bytes at offset of file (dropping anything past it from an interrupted append).
+        """
+
+        with open(self.path / fn, 'ab') as fp:
+            fp.truncate(offset)
+            fp.write(data)
+
+    def append(self, events):
+        """ Append DSAEvents (list or EventTable) to catalog.
+        Appends from several processes are serialized with a file lock.
+        """
+
+        tab = events if isinstance(events, EventTable) else EventTable.from_events(events)
+        if not len(tab):
+            return
+
+        with locking.FileLock(self.path / 'append.lock'):
+            with open(self.path / 'header.json') as fp:
+                self.header = json.load(fp)
+            self._append(tab)
+
+    def _append(self, tab):
+        nrows, heapsize = self.header['nrows'], self.header['heapsize']
+
+        heap = []
+        for name, base, optional in self.types:
+            values = tab.data[name]
+            if base is str:
+                encoded = [_encode_str(vv).encode('utf-8') for vv in values.tolist()]
+                lengths = np.array([len(vv) for vv in encoded], dtype='<i8')
+                offsets = heapsize + np.cumsum(lengths) - lengths
+                heapsize += int(lengths.sum())
+                heap += encoded
+                values = np.stack([offsets, lengths], axis=1)
+                self._append_file(f'{name}.col', values.astype('<i8').tobytes(), nrows*16)
+            else:
+                itemsize = np.dtype(_coltypes[base]).itemsize
+                self._append_file(f'{name}.col', values.astype(_coltypes[base]).tobytes(), nrows*itemsize)
+
+        nulls = np.stack([tab.mask[name] for name in self.optional], axis=1)
+        self._append_file('null.bits', np.packbits(nulls, axis=1).tobytes(), nrows*self.nbytes)
+        self._append_file('heap.bin', b''.join(heap), self.header['heapsize'])
+
+        self._write_header(nrows + len(tab), heapsize)
+
+    def append_files(self, paths, workers=1, chunksize=1000):
+        """ Read trigger json files (see event.create_events) and append them in chunks.
+        Returns list of EventErrors for files that could not be read.
+        """
+
+        events, errors = [], []
+        for ev in event.create_events(paths, workers=workers):
+            if isinstance(ev, event.EventError):
+                errors.append(ev)
+                continue
+            events.append(ev)
+            if len(events) == chunksize:
+                self.append(events)
+                events = []
+        self.append(events)
+        return errors
+
+    def isnull(self, name):
+        """ Boolean array that is True where field is None.
+        """
+
+        if name in dict(self.missing):
+            return np.ones(len(self), dtype=bool)
+        if name not in self.optional:
+            return np.zeros(len(self), dtype=bool)
+        bits = self._memmap('null.bits', 'u1', (len(self), self.nbytes))
+        ii = self.optional.index(name)
+        return (bits[:, ii//8] & (0x80 >> (ii % 8))) > 0
+
+    def column(self, name, rows=slice(None)):
+        """ Return column for field name. Numeric columns are memmaps (masked arrays for optional fields).
+        String columns are decoded from the heap into an array of str (or object, see table._str_array).
+        rows can select a subset of rows (slice, index array or boolean mask).
+        """
+
+        if name in dict(self.missing):
+            dtype = 'U1' if dict(self.missing)[name] is str else _kinds[dict(self.missing)[name]]
+            values = np.full(len(self), _fills[np.dtype(dtype).kind], dtype=dtype)[rows]
+            return np.ma.MaskedArray(values, mask=True)
+
+        base = dict((nn, bb) for nn, bb, oo in self.types)[name]
+        if base is str:
+            pairs = self._memmap(f'{name}.col', '<i8', (len(self), 2))[rows]
+            heap = self._memmap('heap.bin', 'u1', (self.header['heapsize'],))
+            values = _str_array([_decode_str(bytes(heap[off:off+ll]).decode('utf-8'))
+                                 for off, ll in pairs.tolist()])
+        else:
+            values = self._memmap(f'{name}.col', _coltypes[base], (len(self),))[rows]
+
+        if name in self.optional:
+            return np.ma.MaskedArray(values, mask=self.isnull(name)[rows])
+        return values
+
+    def table(self, rows=slice(None)):
+        """ Read catalog (or selected rows) into an EventTable.
+        """
+
+        columns, masks = {}, {}
+        for name, base, optional in event.field_types():
+            values = self.column(name, rows)
+            if optional:
+                columns[name], masks[name] = values.data, values.mask
+            else:
+                columns[name] = values
+        return EventTable.from_columns(columns, masks)
+
+    def event(self, ii):
+        """ Return DSAEvent for row ii.
+        """
+
+        return self.table(rows=[ii]).to_events()[0]
+
+    def __iter__(self):
+        return iter(self.table().to_events())
@@ -3,7 +3,7 @@ import json
 import click
 import csv
 import subprocess
-from event import tns_api_bulk_report, caltechdata, voevent, gcn
+from event import tns_api_bulk_report, caltechdata, voevent, gcn, event, index, journal, catalog, migrate, labels, labelstore, lookup, skymask
 
 @click.group('dsaevent')
 def cli():
@@ -235,3 +235,118 @@ def tns_update_propdate(objname, propdate):
 
     response = tns_api_bulk_report.set_prop_period(objname, propdate)
     print(tns_api_bulk_report.format_to_json(response.text))
+
+
+@cli.command()
+@click.argument('path', type=str, default=event.OUTPUT_PATH)
+def index_refresh(path):
+    """ Create or refresh the SQLite index of candidate json files in path.
+    Only new or modified files are parsed.
+    """
+
+    with index.EventIndex(path) as idx:
+        updated, removed = idx.refresh()
+        print(f'Updated {updated} and removed {removed} entries. Index has {len(idx)} events.')
+
+
+@cli.command()
+@click.argument('path', type=str, default=event.OUTPUT_PATH)
+def journal_compact(path):
+    """ Fold journaled field updates into the candidate json files in path.
+    """
+
+    counts = journal.compact_dir(path)
+    print(f'Compacted {sum(counts.values())} updates into {len(counts)} files.')
+
+
+@cli.command()
+@click.argument('catalogpath', type=str)
+@click.argument('jsonfiles', type=str, nargs=-1)
+@click.option('--workers', type=int, default=1, show_default=True)
+def catalog_append(catalogpath, jsonfiles, workers):
+    """ Append candidate json files to binary event catalog at catalogpath (created if needed).
+    """
+
+    cat = catalog.EventCatalog(catalogpath)
+    errors = cat.append_files(jsonfiles, workers=workers)
+    for error in errors:
+        print(f'Skipped {error.path}: {error.error}')
+    print(f'Catalog {catalogpath} has {len(cat)} events.')
+
+
+@cli.command(name='migrate')
+@click.argument('path', type=str, default=event.OUTPUT_PATH)
+@click.option('--dry-run', is_flag=True, default=False, show_default=True)
+@click.option('--workers', type=int, default=1, show_default=True)
+def migrate_cmd(path, dry_run, workers):
+    """ Rewrite candidate json files in path in the current format with schema_version.
+    Obsolete single-key trigger files are converted. Use --dry-run to only report.
+    """
+
+    fns = sorted(os.path.join(path, fn) for fn in os.listdir(path) if fn.endswith('.json'))
+    results = migrate.migrate(fns, dry_run=dry_run, workers=workers)
+    for fn, status in results.items():
+        if status.startswith('error'):
+            print(f'{fn}: {status}')
+    print(dict(migrate.summary(results)))
+
+
+@cli.command()
+@click.argument('csvfile', type=str)
+@click.option('--workers', type=int, default=8, show_default=True)
+@click.option('--datadir', type=str, default='/home/ubuntu/data/T3', show_default=True)
+@click.option('--journal', is_flag=True, default=False, show_default=True)
+def label_batch(csvfile, workers, datadir, journal):
+    """ Set label, probability and/or notes for many candidates from csvfile.
+    csvfile has header with candname and any of label, probability, notes.
+    """
+
+    results = labels.set_batch(labels.read_batch_csv(csvfile), workers=workers, datadir=datadir, journal=journal)
+    for candname, result in results.items():
+        if result != 'ok':
+            print(f'{candname}: {result}')
+    print(f'Updated {list(results.values()).count("ok")} of {len(results)} candidates.')
+
+
+@cli.command()
+@click.argument('datadir', type=str, default='/home/ubuntu/data/T3')
+@click.option('--workers', type=int, default=8, show_default=True)
+def labels_reconcile(datadir, workers):
+    """ Create or resynchronize the label store in datadir from the candidate json files.
+    """
+
+    with labelstore.LabelStore(datadir) as store:
+        updated, removed = store.reconcile(workers=workers)
+        print(f'Updated {updated} and removed {removed} candidates. Store has {len(store)} candidates.')
+
+
+@cli.command()
+@click.argument('catalogs', type=str, nargs=-1)
+@click.option('--workdir', type=str, default=lookup._install_dir, show_default=True)
+def lookup_build(catalogs, workdir):
+    """ Compile NVSS pickle and/or ATNF text catalogs in workdir into memory-mapped catalogs used by find_associations.
+    Default catalogs are nvss_astropy.pkl and atnfcat_v1.56.txt (those present are built).
+    """
+
+    catalogs = catalogs or [catname for catname in ['nvss_astropy.pkl', 'atnfcat_v1.56.txt']
+                            if os.path.exists(os.path.join(workdir, catname))]
+    for catname in catalogs:
+        outpath = lookup.build_catalog(catname, workdir=workdir)
+        print(f'Compiled {catname} to {outpath}')
+
+
+@cli.command()
+@click.option('--nside', type=int, default=1024, show_default=True)
+@click.option('--nvss-flux', type=float, default=400, show_default=True)
+@click.option('--nvss-radius', type=float, default=60, show_default=True)
+@click.option('--atnf-radius', type=float, default=60, show_default=True)
+@click.option('--workdir', type=str, default=lookup._install_dir, show_default=True)
+@click.option('--outpath', type=str, default=None)
+def skymask_build(nside, nvss_flux, nvss_radius, atnf_radius, workdir, outpath):
+    """ Build HEALPix veto bitmap of pixels near bright NVSS sources and ATNF pulsars for fast candidate checks.
+    """
+
+    outpath = skymask.build_skymask(outpath=outpath, nside=nside, nvss_radius=nvss_radius, nvss_flux=nvss_flux,
+                                    atnf_radius=atnf_radius, workdir=workdir)
+    mask = skymask.SkyMask(outpath)
+    print(f'Flagged {mask.header["nflagged"]} of {skymask.nside2npix(nside)} pixels in {outpath}')
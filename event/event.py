@@ -1,15 +1,145 @@
 import csv
 import os
+import typing
+import dataclasses
 from pathlib import Path
 import json
-from dataclasses import dataclass, asdict
+from operator import attrgetter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, asdict, fields
 from typing import Optional, Any
-from event import tns_api_bulk_report, caltechdata, voevent, labels
+from event import tns_api_bulk_report, caltechdata, voevent, labels, locking
+from event import journal as _journal
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 OUTPUT_PATH = '/dataz/dsa110/operations/T3/'
 
+# version of the json format written by writejson (see migrate.py)
+SCHEMA_VERSION = 1
 
-@dataclass
+CORR_NODES = ['corr03', 'corr04', 'corr05', 'corr06', 'corr07', 'corr08', 'corr10', 'corr11',
+              'corr12', 'corr14', 'corr15', 'corr16', 'corr18', 'corr19', 'corr21', 'corr22']
+
+# per-node/per-beam repeats that are stored as one fixed-length list per group
+_GROUPS = {
+    '_snrs': [f'snrs{i}' for i in range(10)],
+    '_beams': [f'beams{i}' for i in range(10)],
+    '_corr': [f'{corr}_{kind}' for corr in CORR_NODES for kind in ['data', 'header']],
+    '_voltage': [f'voltage_sb{i:02d}' for i in range(16)],
+    '_bfweights': [f'beamformer_weights_sb{i:02d}' for i in range(16)],
+}
+
+
+def _grouped(slot, index, size):
+    """ Property that maps one field name onto an entry of a group list.
+    The list is only allocated once a member of the group is set to something other than None.
+    """
+
+    def fget(self):
+        values = getattr(self, slot)
+        return None if values is None else values[index]
+
+    def fset(self, value):
+        values = getattr(self, slot, None)
+        if values is None:
+            if value is None:
+                setattr(self, slot, None)
+                return
+            values = [None]*size
+            setattr(self, slot, values)
+        values[index] = value
+
+    return property(fget, fset)
+
+
+def _serializer(cls, grouped):
+    """ Build todict function for a compact class.
+    Field order is split into runs of scalar slots (read with one attrgetter) and group lists,
+    so the dict is filled without dataclasses.asdict recursion and deep copies.
+    """
+
+    names = [ff.name for ff in fields(cls)]
+    segments, run = [], []
+    for name in names:
+        if name in grouped:
+            slot, ii, size = grouped[name]
+            if ii == 0:
+                if run:
+                    segments.append((attrgetter(*run), len(run)))
+                    run = []
+                segments.append((attrgetter(slot), -size))
+        else:
+            run.append(name)
+    if run:
+        segments.append((attrgetter(*run), len(run)))
+
+    def todict(self):
+        """ Convert event to dict of fields. Same result as dataclasses.asdict.
+        """
+
+        values = []
+        for getter, size in segments:
+            if size == 1:
+                values.append(getter(self))
+            elif size > 1:
+                values.extend(getter(self))
+            else:
+                group = getter(self)
+                values.extend([None]*-size if group is None else group)
+        return dict(zip(names, values))
+
+    return todict
+
+
+def dumps(dd, compact=False):
+    """ Serialize dict to json string.
+    compact=True uses orjson, if installed, and no whitespace.
+    Values orjson cannot serialize fall back to json.dumps with the same separators.
+    Otherwise uses same format as json.dumps.
+    """
+
+    if not compact:
+        return json.dumps(dd)
+    if orjson is not None:
+        try:
+            return orjson.dumps(dd, option=orjson.OPT_SERIALIZE_NUMPY).decode('utf-8')
+        except TypeError:
+            pass
+    return json.dumps(dd, ensure_ascii=False, separators=(',', ':'))
+
+
+def _compact(cls):
+    """ Turn the class into a dataclass without instance __dict__.
+    Scalar fields become slots and the repeated groups in _GROUPS share one slot per group.
+    Field names, dataclasses.fields/asdict and the generated __init__ keep working.
+    """
+
+    cls = dataclass(cls)
+    names = [ff.name for ff in fields(cls)]
+    grouped = {name: (slot, ii, len(members)) for slot, members in _GROUPS.items()
+               for ii, name in enumerate(members)}
+    assert set(grouped) <= set(names), "group member is not a field"
+
+    cls_dict = dict(cls.__dict__)
+    for name in names:
+        cls_dict.pop(name, None)
+    cls_dict.pop('__dict__', None)
+    cls_dict.pop('__weakref__', None)
+    cls_dict['__slots__'] = tuple(name for name in names if name not in grouped) + tuple(_GROUPS)
+    for name, (slot, ii, size) in grouped.items():
+        cls_dict[name] = _grouped(slot, ii, size)
+
+    newcls = type(cls)(cls.__name__, cls.__bases__, cls_dict)
+    newcls.__qualname__ = cls.__qualname__
+    newcls.todict = _serializer(newcls, grouped)
+    return newcls
+
+
+@_compact
 class DSAEvent:
     mjds: float
     snr: float
@@ -131,12 +261,14 @@ class DSAEvent:
     beamformer_weights_sb13: Optional[str] = None
     beamformer_weights_sb14: Optional[str] = None
     beamformer_weights_sb15: Optional[str] = None
+    schema_version: Optional[int] = SCHEMA_VERSION
     
-    def tojson(self):
+    def tojson(self, compact=False):
         """ Convert event dict to json string.
+        compact=True uses fastest available json backend and no whitespace.
         """
 
-        jj = json.dumps(asdict(self))
+        jj = dumps(self.todict(), compact=compact)
         return jj
 
     def update(self, other):
@@ -144,19 +276,26 @@ class DSAEvent:
         """
 
         if isinstance(other, DSAEvent):
-            other = asdict(other)
+            other = other.todict()
 
         assert isinstance(other, dict), "update method takes DSACand or dict as argument"
 
         for kk,vv in other.items():
-            if kk in self.__dict__:
-                if self.__dict__[kk] is None:
-                    self.__dict__[kk] = vv
+            if kk in self.__dataclass_fields__:
+                if getattr(self, kk) is None:
+                    setattr(self, kk, vv)
             else:
                 print(f"key {kk} not in DSACand")
 
-    def writejson(self, outpath=OUTPUT_PATH, lock=None):
+    def writejson(self, outpath=OUTPUT_PATH, lock=None, compact=False, journal=False):
         """ Writes event to JSON or updates JSON file that already exists.
+        Holds the file lock for trigname in outpath and replaces the file atomically.
+        lock is an optional additional (e.g., dask) lock.
+        compact=True writes without indentation (with orjson, if installed).
+        An existing file is updated like DSAEvent.update: fields already set in the file (with its journal)
+        are kept and fields that are None there are filled in from this event.
+        journal=True appends only those filled-in fields to the journal of an existing file
+        instead of rewriting it (see journal.compact).
         """
 
         fn = Path(outpath) / Path(f'{self.trigname}.json')
@@ -164,45 +303,221 @@ class DSAEvent:
         if lock is not None:
             lock.acquire(timeout="5s")
 
-        if not Path(fn).exists():
-            with open(fn, 'w') as fp:
-                json.dump(asdict(self), fp, ensure_ascii=False, indent=4)
-        else:
-            dsaevent0 = create_event(fn)
-            dsaevent0.update(self)
-            with open(fn, 'w') as fp:
-                json.dump(asdict(self), fp, ensure_ascii=False, indent=4)
+        try:
+            with locking.lock(self.trigname, outpath, timeout=5):
+                if fn.exists():
+                    dd = _journal.merge(fn, trigger_dict(_read_json(fn)))
+                    delta = {kk: vv for kk, vv in self.todict().items() if vv is not None and dd.get(kk) is None}
+                    if journal:
+                        if delta:
+                            _journal.append(fn, delta, locked=True)
+                        return
+                    dd.update(delta)
+                else:
+                    dd = self.todict()
+
+                if compact:
+                    jj = dumps(dd, compact=True)
+                else:
+                    jj = json.dumps(dd, ensure_ascii=False, indent=4)
+                locking.atomic_write(fn, jj)
+                _journal.discard(fn)  # file now holds the merged event, journal would override it
+        finally:
+            if lock is not None:
+                lock.release()
+
+        from event import index
+        index.notify(fn)
+
+
+# fields read up front by create_event(lazy=True)
+LAZY_FIELDS = ['mjds', 'snr', 'ibox', 'dm', 'ibeam', 'cntb', 'cntc', 'specnum', 'ra', 'dec', 'trigname',
+               'raerr', 'decerr', 'radecerr', 'dmerr', 'bf1_dm', 'save', 'label', 'injected', 'probability']
+
+
+def _read_json(fn):
+    """ Read json file with orjson, if installed.
+    """
 
-        if lock is not None:
-            lock.release()
+    if orjson is not None:
+        with open(fn, 'rb') as fp:
+            return orjson.loads(fp.read())
+    with open(fn) as fp:
+        return json.load(fp)
 
 
-def create_event(fn):
-    """ Create a DSAEvent from a json file
+class LazyDSAEvent(DSAEvent):
+    """ DSAEvent that holds only LAZY_FIELDS after reading a json file.
+    The first access to any other field reads the file again and fills in the remaining fields.
+    Created by create_event(fn, lazy=True). Otherwise behaves like a DSAEvent.
     """
 
-    assert Path(fn).exists(), f"File {fn} not found"
-    with open(fn) as fp:
-        dd = json.load(fp)
+    __slots__ = ('_source',)
+
+    @classmethod
+    def from_dict(cls, dd, source):
+        """ Create lazy event from trigger dict dd read from file source.
+        Keys that are not DSAEvent fields (e.g., notes written by labels.set_notes) are ignored.
+        """
+
+        ev = object.__new__(cls)
+        for name in LAZY_FIELDS:
+            if name in dd:
+                setattr(ev, name, dd[name])
+            elif cls.__dataclass_fields__[name].default is not dataclasses.MISSING:
+                setattr(ev, name, cls.__dataclass_fields__[name].default)
+            else:
+                raise TypeError(f'missing required field {name}')
+        ev._source = str(source)
+        return ev
+
+    def _isset(self, name):
+        """ Check whether scalar slot of DSAEvent is set without calling __getattr__.
+        """
 
-    if len(dd) != 1:
         try:
-            dsaevent = DSAEvent(**dd)
-        except TypeError:
-            dsaevent = None
-            print('Error reading json file. It may have extra keys?')
+            DSAEvent.__dict__[name].__get__(self, DSAEvent)
+            return True
+        except AttributeError:
+            return False
+
+    def _materialize(self):
+        """ Read remaining fields from source file. Fields already set are kept.
+        """
+
+        source, self._source = self._source, None
+        dd = _journal.merge(source, trigger_dict(_read_json(source)))
+        for slot in _GROUPS:
+            setattr(self, slot, None)
+        for name, ff in self.__dataclass_fields__.items():
+            if name in DSAEvent.__slots__ and self._isset(name):
+                continue
+            setattr(self, name, dd.get(name, ff.default))
+
+    def __getattr__(self, name):
+        # only called for slots that are not set yet
+        if name == '_source' or (name not in self.__dataclass_fields__ and name not in _GROUPS):
+            raise AttributeError(name)
+        if self._source is None:
+            raise AttributeError(name)
+
+        self._materialize()
+        return getattr(self, name)
+
+    def __eq__(self, other):
+        if isinstance(other, DSAEvent):
+            return self.todict() == other.todict()
+        return NotImplemented
+
+
+def field_types():
+    """ Get list of (name, type, optional) for DSAEvent fields.
+    type is the base type (float, int, bool or str) with Optional removed.
+    """
+
+    types = []
+    for ff in fields(DSAEvent):
+        args = typing.get_args(ff.type)
+        optional = type(None) in args
+        base = [aa for aa in args if aa is not type(None)][0] if args else ff.type
+        types.append((ff.name, base, optional))
+    return types
+
+
+def trigger_dict(dd):
+    """ Return trigger dict in the current (flat) format.
+    Converts the obsolete {trigname: {...}} format written by the initial trigger.
+    Files with schema_version (written by writejson or migrate) are returned without further checks.
+    """
+
+    if 'schema_version' in dd or len(dd) != 1:
+        return dd
+
+    trigname = list(dd.keys())[0]
+    dd2 = dict(dd[trigname])
+    dd2['trigname'] = trigname
+    return dd2
+
+
+def create_event(fn, lazy=False):
+    """ Create a DSAEvent from a json file
+    lazy=True returns a LazyDSAEvent that reads fields beyond LAZY_FIELDS only when accessed.
+    """
+
+    assert Path(fn).exists(), f"File {fn} not found"
+    if lazy:
+        dd = _read_json(fn)
     else:
-        # obsolete format written by initial trigger
+        with open(fn) as fp:
+            dd = json.load(fp)
+
+    if 'schema_version' not in dd and len(dd) == 1:
+        # obsolete format written by initial trigger (convert files with "dsaevent migrate")
         print('Found old trigger json format')
-        assert len(dd), "dictionary read from json is empty"
-        trigname = list(dd.keys())[0]  
-        dd2 = dd[trigname]
-        dd2['trigname'] = trigname
-        dsaevent = DSAEvent(**dd2)
+    dd = _journal.merge(fn, trigger_dict(dd))
+
+    try:
+        if lazy:
+            dsaevent = LazyDSAEvent.from_dict(dd, fn)
+        else:
+            dsaevent = DSAEvent(**dd)
+    except TypeError:
+        dsaevent = None
+        print('Error reading json file. It may have extra keys?')
 
     return dsaevent
 
 
+@dataclass
+class EventError:
+    """ Failure to read one trigger json file, as yielded by create_events.
+    """
+
+    path: str
+    error: str
+
+
+def _load_event(fn):
+    """ Read trigger json file in current or obsolete format.
+    Returns DSAEvent or EventError, so it can run in worker process without raising.
+    """
+
+    try:
+        with open(fn) as fp:
+            dd = trigger_dict(json.load(fp))
+        return DSAEvent(**_journal.merge(fn, dd))
+    except (OSError, ValueError, TypeError, AttributeError) as exc:
+        return EventError(str(fn), f'{type(exc).__name__}: {exc}')
+
+
+def _load_events(fns):
+    return [_load_event(fn) for fn in fns]
+
+
+def create_events(paths, workers=1, ordered=True, chunksize=16):
+    """ Generator that reads many trigger json files.
+    Yields DSAEvent for each file or EventError for files that cannot be read.
+    workers > 1 parses files in a process pool.
+    ordered=True yields in order of paths, otherwise in order of completion (in chunks of chunksize files).
+    """
+
+    paths = [str(fn) for fn in paths]
+    if workers is None or workers <= 1:
+        for fn in paths:
+            yield _load_event(fn)
+        return
+
+    chunks = [paths[ii:ii+chunksize] for ii in range(0, len(paths), chunksize)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        if ordered:
+            for events in executor.map(_load_events, chunks):
+                yield from events
+        else:
+            futures = [executor.submit(_load_events, chunk) for chunk in chunks]
+            for future in as_completed(futures):
+                yield from future.result()
+
+
 def doit(triggerfile, remarks, notes=None, files=None, production=True, getdoi=True, version=0.1, propdate=None, send=True, repeater_of_objid=None, csvfile='events.csv'):
     """
     Automated release of event via its T2 json trigger file.
@@ -3,6 +3,7 @@ import os
 import sys
 from gcn_kafka import Producer
 from astropy.time import Time
+from event import event
 
 def gcn_send(jsonfile, env='prod', topic='gcn.notices.dsa110.frb'):
     """ Use trigger json to send GCN notice
@@ -35,19 +36,18 @@ def gcn_send(jsonfile, env='prod', topic='gcn.notices.dsa110.frb'):
 
     # Initialize and overload dict with json values
     jsondata = {'$schema': 'https://gcn.nasa.gov/schema/v6.1.0/gcn/notices/dsa110/frb.schema.json'}
-    with open(jsonfile, 'r') as fp:
-        trig = json.load(fp)
+    trig = event.create_event(jsonfile, lazy=True)
 
     jsondata["alert_type"] = "initial"
-    jsondata["trigger_time"] = Time(trig["mjds"], format="mjd").isot
-    jsondata["id"] = trig["trigname"]
-    jsondata["snr"] = trig["snr"]
-    jsondata["dm"] = trig["dm"]
-    jsondata["event_duration"] = 0.262144*trig["ibox"] # ms TODO: check
-    jsondata["ra"] = trig["ra"]
-    jsondata["dec"] = trig["dec"]
+    jsondata["trigger_time"] = Time(trig.mjds, format="mjd").isot
+    jsondata["id"] = trig.trigname
+    jsondata["snr"] = trig.snr
+    jsondata["dm"] = trig.dm
+    jsondata["event_duration"] = 0.262144*trig.ibox # ms TODO: check
+    jsondata["ra"] = trig.ra
+    jsondata["dec"] = trig.dec
     jsondata["ra_dec_error"] = [0.016, 0.016]  # 1' is about the zenith search beam width
-    jsondata["importance"] = trig["probability"]
+    jsondata["importance"] = trig.probability
         
     # JSON data converted to byte string format
     data = json.dumps(jsondata).encode("utf-8")
@@ -0,0 +1,206 @@
+import os
+import json
+import sqlite3
+import dataclasses
+from pathlib import Path
+from event import event, journal
+from event.table import _encode_str, _decode_str
+
+INDEX_NAME = '.dsaevent_index.sqlite'
+
+# version of the stored values, indexes with another version are rebuilt
+INDEX_VERSION = 1
+
+_sqltypes = {float: 'REAL', int: 'INTEGER', bool: 'INTEGER', str: 'TEXT'}
+
+
+def _sqlvalue(value, base):
+    """ Value stored for field of type base. Non-str values of str fields (e.g., True from labels.check_voltages)
+    are stored as table._encode_str text, so events() returns them unchanged.
+    """
+
+    if value is None:
+        return None
+    if base is str:
+        return _encode_str(value)
+    return value if isinstance(value, (int, float)) else json.dumps(value)
+
+
+class EventIndex:
+    """ SQLite index of the DSAEvent json files in one directory (default is T3 OUTPUT_PATH).
+    Stores all DSAEvent fields, so queries do not need to open json files.
+    refresh only parses files that are new or have changed mtime/size since the last refresh.
+    """
+
+    def __init__(self, path=event.OUTPUT_PATH, dbfile=None):
+        self.path = Path(path)
+        self.dbfile = Path(dbfile) if dbfile is not None else self.path / INDEX_NAME
+        self.types = event.field_types()
+        self.names = [name for name, base, optional in self.types]
+        self.defaults = dict((ff.name, ff.default) for ff in dataclasses.fields(event.DSAEvent)
+                             if ff.default is not dataclasses.MISSING)
+        self.con = sqlite3.connect(str(self.dbfile), timeout=30)
+        self._create()
+
+    def _create(self):
+        """ Create events table. Rebuilds it if DSAEvent fields or INDEX_VERSION have changed.
+        """
+
+        columns = ['_mtime', '_size'] + self.names
+        existing = [row[1] for row in self.con.execute('PRAGMA table_info(events)')]
+        version = self.con.execute('PRAGMA user_version').fetchone()[0]
+        if existing and (existing != columns or version != INDEX_VERSION):
+            print('DSAEvent fields or index version changed. Rebuilding index.')
+            self.con.execute('DROP TABLE events')
+
+        coldefs = ', '.join([f'"{name}" {_sqltypes[base]}' for name, base, optional in self.types])
+        with self.con:
+            self.con.execute(f'CREATE TABLE IF NOT EXISTS events (_mtime INTEGER, _size INTEGER, {coldefs}, '
+                             'PRIMARY KEY (trigname))')
+            for name in ['mjds', 'dm', 'snr', 'label', 'save']:
+                self.con.execute(f'CREATE INDEX IF NOT EXISTS idx_{name} ON events ("{name}")')
+            self.con.execute(f'PRAGMA user_version = {INDEX_VERSION}')
+
+    def close(self):
+        self.con.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.con.execute('SELECT COUNT(*) FROM events').fetchone()[0]
+
+    def _row(self, fn, stat):
+        """ Read json file and return row for events table or None if it is not a DSAEvent file.
+        """
+
+        try:
+            with open(fn) as fp:
+                dd = journal.merge(fn, event.trigger_dict(json.load(fp)))
+        except (OSError, ValueError):
+            return None
+
+        if not isinstance(dd, dict) or any([dd.get(name) is None
+                                            for name, base, optional in self.types if not optional]):
+            return None
+        if Path(fn).stem != dd['trigname']:
+            return None
+
+        values = [dd.get(name, self.defaults.get(name)) for name in self.names]
+        values = [_sqlvalue(vv, base) for vv, (name, base, optional) in zip(values, self.types)]
+        return [stat.st_mtime_ns, stat.st_size] + values
+
+    def _upsert(self, rows):
+        marks = ', '.join(['?']*(len(self.names) + 2))
+        with self.con:
+            self.con.executemany(f'INSERT OR REPLACE INTO events VALUES ({marks})', rows)
+
+    def refresh(self):
+        """ Scan directory and update index for new, changed and removed json files.
+        Returns tuple of number of (updated, removed) entries.
+        """
+
+        known = dict((trigname, (mtime, size)) for trigname, mtime, size in
+                     self.con.execute('SELECT trigname, _mtime, _size FROM events'))
+
+        rows, seen = [], set()
+        with os.scandir(self.path) as it:
+            for entry in it:
+                if not entry.name.endswith('.json') or not entry.is_file():
+                    continue
+                trigname = entry.name[:-5]
+                seen.add(trigname)
+                stat = entry.stat()
+                if known.get(trigname) == (stat.st_mtime_ns, stat.st_size):
+                    continue
+                row = self._row(entry.path, stat)
+                if row is not None:
+                    rows.append(row)
+
+        removed = [(trigname,) for trigname in known if trigname not in seen]
+        self._upsert(rows)
+        with self.con:
+            self.con.executemany('DELETE FROM events WHERE trigname = ?', removed)
+
+        return len(rows), len(removed)
+
+    def update_file(self, fn):
+        """ Add or update a single json file in the index.
+        """
+
+        fn = Path(fn)
+        if not fn.exists():
+            with self.con:
+                self.con.execute('DELETE FROM events WHERE trigname = ?', (fn.stem,))
+            return
+
+        row = self._row(fn, fn.stat())
+        if row is not None:
+            self._upsert([row])
+
+    def _select(self, columns, mjd_range=None, dm_range=None, snr_min=None, label=None, unlabeled=False, save=None):
+        conditions, params = [], []
+        for name, limits in [('mjds', mjd_range), ('dm', dm_range)]:
+            if limits is not None:
+                conditions.append(f'{name} BETWEEN ? AND ?')
+                params += list(limits)
+        if snr_min is not None:
+            conditions.append('snr >= ?')
+            params.append(snr_min)
+        if label is not None:
+            conditions.append('label = ?')
+            params.append(label)
+        if unlabeled:
+            conditions.append("(label IS NULL OR label = '')")
+        if save is not None:
+            conditions.append('save = ?' if save else '(save IS NULL OR save = 0)')
+            if save:
+                params.append(1)
+
+        where = f' WHERE {" AND ".join(conditions)}' if conditions else ''
+        return self.con.execute(f'SELECT {columns} FROM events{where} ORDER BY mjds', params)
+
+    def query(self, **kwargs):
+        """ Return list of trignames that match selection.
+        Arguments are mjd_range and dm_range (tuple of min, max), snr_min, label, unlabeled and save.
+        """
+
+        return [row[0] for row in self._select('trigname', **kwargs)]
+
+    def events(self, **kwargs):
+        """ Return list of DSAEvents that match selection (see query).
+        """
+
+        columns = ', '.join([f'"{name}"' for name in self.names])
+        bools = [ii for ii, (name, base, optional) in enumerate(self.types) if base is bool]
+        strs = [ii for ii, (name, base, optional) in enumerate(self.types) if base is str]
+        events = []
+        for row in self._select(columns, **kwargs):
+            row = list(row)
+            for ii in bools:
+                if row[ii] is not None:
+                    row[ii] = bool(row[ii])
+            for ii in strs:
+                if row[ii] is not None:
+                    row[ii] = _decode_str(row[ii])
+            events.append(event.DSAEvent(**dict(zip(self.names, row))))
+        return events
+
+
+def notify(fn):
+    """ Update index for json file fn, if the directory has an index.
+    Called after writing candidate json files, so the index stays current.
+    """
+
+    dbfile = Path(fn).parent / INDEX_NAME
+    if not dbfile.exists():
+        return
+
+    try:
+        with EventIndex(Path(fn).parent, dbfile=dbfile) as index:
+            index.update_file(fn)
+    except sqlite3.Error as exc:
+        print(f'Could not update index {dbfile}: {exc}')
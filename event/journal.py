@@ -0,0 +1,143 @@
+import os
+import json
+import time
+from pathlib import Path
+from event import locking
+
+# Journal of field updates for candidate json files.
+# Each update is one line appended to <trigname>.journal next to <trigname>.json.
+# Lines are short and written with a single O_APPEND write, so concurrent writers do not interleave.
+
+
+def journal_path(fn):
+    return Path(fn).with_suffix('.journal')
+
+
+def _compacting_path(fn):
+    return Path(fn).with_suffix('.journal.compacting')
+
+
+def _write(fn, line):
+    fd = os.open(journal_path(fn), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line.encode('utf-8'))
+    finally:
+        os.close(fd)
+
+
+def append(fn, fields, locked=False):
+    """ Append update of fields (dict) for json file fn to its journal.
+    Holds the file lock of fn, so the update cannot land in a journal that compact or a direct write is removing.
+    locked=True if the caller already holds the file lock of fn.
+    """
+
+    line = json.dumps({'time': time.time(), 'fields': fields}) + '\n'
+    if locked:
+        _write(fn, line)
+    else:
+        with locking.lock(Path(fn).stem, Path(fn).parent, timeout=5):
+            _write(fn, line)
+
+    from event import index
+    index.notify(fn)
+
+
+def deltas(fn):
+    """ Return list of field updates (dicts) in journal for json file fn, oldest first.
+    A partial last line (e.g., from a crashed writer) is ignored.
+    """
+
+    updates = []
+    for path in [_compacting_path(fn), journal_path(fn)]:
+        try:
+            with open(path) as fp:
+                lines = fp.readlines()
+        except FileNotFoundError:
+            continue
+
+        for line in lines:
+            try:
+                updates.append(json.loads(line)['fields'])
+            except (ValueError, KeyError):
+                print(f'Skipping bad journal line in {path}')
+    return updates
+
+
+def merge(fn, dd):
+    """ Apply journal updates for json file fn to dict dd read from it.
+    Returns dd unchanged if there is no journal.
+    """
+
+    if not journal_path(fn).exists() and not _compacting_path(fn).exists():
+        return dd
+
+    for update in deltas(fn):
+        dd.update(update)
+    return dd
+
+
+def read(fn):
+    """ Read json file fn and return dict with journal updates applied.
+    """
+
+    with open(fn) as fp:
+        dd = json.load(fp)
+    return merge(fn, dd)
+
+
+def discard(fn):
+    """ Remove journal of json file fn after a direct write of its merged contents.
+    Caller holds the file lock of fn, so no update can be appended in between.
+    """
+
+    for path in [journal_path(fn), _compacting_path(fn)]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def compact(fn):
+    """ Fold journal updates into json file fn and remove the journal.
+    Holds the file lock of fn, like writejson and labels.
+    The journal is renamed before reading, so updates appended during compaction go to a new journal.
+    Returns number of updates folded in.
+    """
+
+    journal, compacting = journal_path(fn), _compacting_path(fn)
+    with locking.lock(Path(fn).stem, Path(fn).parent, timeout=5):
+        if journal.exists() and not compacting.exists():
+            os.replace(journal, compacting)
+        if not compacting.exists():
+            return 0
+
+        with open(fn) as fp:
+            dd = json.load(fp)
+        updates = []
+        with open(compacting) as fp:
+            for line in fp:
+                try:
+                    updates.append(json.loads(line)['fields'])
+                except (ValueError, KeyError):
+                    print(f'Skipping bad journal line in {compacting}')
+        for update in updates:
+            dd.update(update)
+
+        locking.atomic_write(fn, json.dumps(dd, ensure_ascii=False, indent=4))
+        os.remove(compacting)
+
+    return len(updates)
+
+
+def compact_dir(path):
+    """ Compact all journals in directory path.
+    Returns dict of json file name and number of updates folded in.
+    """
+
+    fns = set([Path(path) / (jn.name.split('.')[0] + '.json')
+               for jn in list(Path(path).glob('*.journal')) + list(Path(path).glob('*.journal.compacting'))])
+    counts = {}
+    for fn in sorted(fns):
+        if fn.exists():
+            counts[fn.name] = compact(fn)
+    return counts
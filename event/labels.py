@@ -1,16 +1,31 @@
+import io
+import csv
+import bz2
+import gzip
+import lzma
 import json
 import os.path
 import numpy as np
+import time
 import subprocess
-import pipes
+import shlex
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from event import locking
+from event import journal as _journal
 
 _allowed = ['astrophysical', 'injection', 'instrumental', 'unsure/noise', 'rfi', 'save', '']
 
 
+# reuse one ssh connection per host for 60 s and fail fast on dead hosts
+_ssh_options = ['-o', 'BatchMode=yes', '-o', 'ConnectTimeout=5',
+                '-o', 'ControlMaster=auto', '-o', 'ControlPath=~/.ssh/cm-%r@%h:%p', '-o', 'ControlPersist=60']
+
+
 def exists_remote(host, path):
     """Test if a file exists at path on a host accessible with SSH."""
     status = subprocess.call(
-        ['ssh', host, 'test -f {}'.format(pipes.quote(path))])
+        ['ssh'] + _ssh_options + [host, 'test -f {}'.format(shlex.quote(path))])
     if status == 0:
         return True
     if status == 1:
@@ -18,34 +33,253 @@ def exists_remote(host, path):
     raise Exception('SSH failed')
 
 
-def check_voltages(candname):
+def probe_remote(host, paths, timeout=10):
+    """ Test if files exist at paths on a host with one SSH call.
+    Returns list with True/False per path, or None per path if host did not answer within timeout (seconds).
+    """
+
+    cmd = '; '.join([f'if test -f {shlex.quote(path)}; then echo 1; else echo 0; fi' for path in paths])
+    try:
+        result = subprocess.run(['ssh'] + _ssh_options + [host, cmd], capture_output=True, text=True, timeout=timeout)
+    except (subprocess.TimeoutExpired, OSError):
+        return [None]*len(paths)
+
+    found = result.stdout.split()
+    if result.returncode != 0 or len(found) != len(paths):
+        return [None]*len(paths)
+    return [ff == '1' for ff in found]
+
+
+def check_voltages(candname, workers=16, timeout=10):
+    """ Check corr nodes for voltage data and header files of candname and set corrNN_data/header in json file.
+    Nodes are probed in parallel with one SSH call each.
+    Returns dict of corr and (data, header) with True/False, or None if node could not be reached.
+    """
 
     filename = f'/home/ubuntu/data/T3/{candname}.json'
     assert os.path.exists(filename), f'candidate json file {filename} not found'
-    dd = readfile(filename=filename, candname=candname)
-    
-    corrs = ['corr03','corr04','corr05','corr06','corr07','corr08','corr10','corr11','corr12','corr14','corr15','corr16','corr18','corr19','corr21','corr22']
 
-    # edit corr03_data and corr03_header
-    for corr in corrs:
+    from event.event import CORR_NODES
+
+    data_file = '/home/ubuntu/data/'+candname+'_data.out'
+    header_file = '/home/ubuntu/data/'+candname+'_header.json'
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        probes = pool.map(lambda corr: probe_remote(corr+'.sas.pvt', [data_file, header_file], timeout=timeout),
+                          CORR_NODES)
+        found = dict(zip(CORR_NODES, probes))
 
-        data_file = '/home/ubuntu/data/'+candname+'_data.out'
-        header_file = '/home/ubuntu/data/'+candname+'_header.json'
-        if exists_remote(corr+'.sas.pvt', data_file):
-            dd[corr+'_data'] = True
+    # edit corr03_data and corr03_header
+    fields = {}
+    for corr, (data, header) in found.items():
+        if data is None:
+            print('Unknown (no response):', corr)
+        if data:
+            fields[corr+'_data'] = True
             print('Found data:', corr)
-        if exists_remote(corr+'.sas.pvt', header_file):
-            dd[corr+'_header'] = True
+        if header:
+            fields[corr+'_header'] = True
             print('Found header:', corr)
 
-    writefile(dd, candname=candname, filename=filename)
+    _update(fields, filename=filename)
+    return found
+
+
+class VoltageInventory:
+    """ Cached listing of files in datadir on each corr node, for checking voltages of many candidates.
+    refresh lists each node with one SSH call. After the first listing only files newer than the
+    previous listing are fetched, with a full listing every full_every refreshes to drop deleted files.
+    Listings older than ttl (seconds) are refreshed automatically by check and complete.
+    """
+
+    def __init__(self, corrs=None, datadir='/home/ubuntu/data/', ttl=60, full_every=10, workers=16, timeout=30):
+        from event.event import CORR_NODES
+
+        self.corrs = corrs if corrs is not None else CORR_NODES
+        self.datadir = datadir
+        self.ttl = ttl
+        self.full_every = full_every
+        self.workers = workers
+        self.timeout = timeout
+        self.files = {corr: set() for corr in self.corrs}
+        self.stamp = {corr: None for corr in self.corrs}    # remote time of last listing
+        self.checked = {corr: None for corr in self.corrs}  # local time of last attempt
+        self.ok = {corr: False for corr in self.corrs}
+        self.nrefresh = 0
+
+    def _list(self, corr, since=None):
+        """ List file names in datadir on corr. Returns (remote time, set of names) or None on failure.
+        since (remote unix time) lists only files modified after it.
+        """
+
+        newer = f' -newermt @{since - 5}' if since is not None else ''
+        cmd = f"date +%s; find {shlex.quote(self.datadir)} -maxdepth 1 -type f{newer} -printf '%f\\n'"
+        try:
+            result = subprocess.run(['ssh'] + _ssh_options + [corr+'.sas.pvt', cmd], capture_output=True,
+                                    text=True, timeout=self.timeout)
+        except (subprocess.TimeoutExpired, OSError):
+            return None
+        lines = result.stdout.splitlines()
+        if result.returncode != 0 or not lines or not lines[0].isdigit():
+            return None
+        return int(lines[0]), set(lines[1:])
+
+    def refresh(self, full=False, stale_only=False):
+        """ Update listings of all nodes in parallel. full=True lists all files again.
+        stale_only=True skips nodes listed less than ttl seconds ago.
+        """
+
+        now = time.time()
+        full = full or (self.full_every and self.nrefresh % self.full_every == 0)
+        corrs = [corr for corr in self.corrs if not stale_only or self.checked[corr] is None
+                 or now - self.checked[corr] > self.ttl]
+        if not corrs:
+            return
+
+        def listing(corr):
+            return self._list(corr, since=None if full or not self.ok[corr] else self.stamp[corr])
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            results = dict(zip(corrs, pool.map(listing, corrs)))
+
+        for corr, result in results.items():
+            self.checked[corr] = now
+            if result is None:
+                print('Unknown (no response):', corr)
+                self.ok[corr] = False
+                continue
+            stamp, names = result
+            if full or not self.ok[corr]:
+                self.files[corr] = names
+            else:
+                self.files[corr] |= names
+            self.stamp[corr] = stamp
+            self.ok[corr] = True
+        self.nrefresh += 1
+
+    def status(self, candname):
+        """ Return dict of corr and (data, header) with True/False, or None for nodes without listing.
+        Uses current listings without refreshing.
+        """
+
+        data_file, header_file = candname+'_data.out', candname+'_header.json'
+        return {corr: (data_file in self.files[corr], header_file in self.files[corr]) if self.ok[corr]
+                else (None, None) for corr in self.corrs}
+
+    def check(self, candnames):
+        """ Return dict of candname and status (see status). Refreshes stale listings first.
+        """
+
+        self.refresh(stale_only=True)
+        return {candname: self.status(candname) for candname in candnames}
+
+    def complete(self, candnames):
+        """ Return list of candnames with data and header files on all nodes.
+        """
+
+        return [candname for candname, found in self.check(candnames).items()
+                if all([data and header for data, header in found.values()])]
+
+
+def check_voltages_batch(candnames, inventory=None, datadir='/home/ubuntu/data/T3'):
+    """ Set corrNN_data/header in json files of many candidates from one listing per corr node.
+    inventory is a VoltageInventory to reuse between calls (cached for its ttl).
+    Returns dict of candname and status (see VoltageInventory.status),
+    or 'error: <reason>' for candidates whose json file could not be updated (as set_batch).
+    """
+
+    inventory = inventory if inventory is not None else VoltageInventory()
+    found = inventory.check(candnames)
+    for candname, status in found.items():
+        fields = {}
+        for corr, (data, header) in status.items():
+            if data:
+                fields[corr+'_data'] = True
+            if header:
+                fields[corr+'_header'] = True
+        if fields:
+            try:
+                _update(fields, candname=candname, datadir=datadir)
+            except (AssertionError, ValueError, TypeError, OSError) as exc:
+                found[candname] = f'error: {exc}'
+    return found
+
+
+_magic = [(b'\x93NUMPY', 'npy'), (b'PK\x03\x04', 'npz'), (b'\x1f\x8b', 'gzip'), (b'BZh', 'bz2'),
+          (b'\xfd7zXZ\x00', 'xz')]
+
+
+def _sniff(head):
+    for magic, fmt in _magic:
+        if head.startswith(magic):
+            return fmt
+    if head.lstrip(b' \t\r\n\xef\xbb\xbf')[:1] in (b'{', b'['):
+        return 'json'
+    return None
+
+
+def sniff_format(filename):
+    """ Detect file format from first bytes.
+    Returns 'json', 'npy', 'npz', 'gzip', 'bz2', 'xz' or None.
+    """
+
+    with open(filename, 'rb') as fp:
+        return _sniff(fp.read(16))
+
+
+def loadfile(filename, mmap_mode='r'):
+    """ Read json, npy, npz or gzip/bz2/xz-compressed json or npy file, using its magic bytes.
+    Plain npy arrays are memory mapped (mmap_mode). Only object arrays (plain or compressed) are loaded with pickle.
+    Returns dict/list for json, ndarray for npy and NpzFile for npz. Raises ValueError for unknown formats.
+    """
+
+    fmt = sniff_format(filename)
+    if fmt == 'json':
+        with open(filename, 'r') as fp:
+            return json.load(fp)
+    elif fmt == 'npy':
+        try:
+            return np.load(filename, mmap_mode=mmap_mode, allow_pickle=False)
+        except ValueError:
+            return np.load(filename, allow_pickle=True)
+    elif fmt == 'npz':
+        return np.load(filename, allow_pickle=False)
+    elif fmt in ['gzip', 'bz2', 'xz']:
+        opener = {'gzip': gzip.open, 'bz2': bz2.open, 'xz': lzma.open}[fmt]
+        with opener(filename, 'rb') as fp:
+            data = fp.read()
+        inner = _sniff(data[:16])
+        if inner == 'json':
+            return json.loads(data)
+        elif inner == 'npy':
+            try:
+                return np.load(io.BytesIO(data), allow_pickle=False)
+            except ValueError:
+                return np.load(io.BytesIO(data), allow_pickle=True)
+        raise ValueError(f'Unknown format inside compressed file {filename}')
+
+    raise ValueError(f'Unknown format for file {filename}')
+
+
+def loadfiles(filenames, workers=8, mmap_mode='r'):
+    """ Read many files with loadfile in a thread pool.
+    Yields (filename, data) in order. data is None for files that could not be read.
+    """
+
+    def load(filename):
+        try:
+            return filename, loadfile(filename, mmap_mode=mmap_mode)
+        except (OSError, ValueError, EOFError):
+            return filename, None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(load, filenames)
 
 
 def readfile(filename=None, candname=None, datadir='/home/ubuntu/data/T3'):
     """ Read candidate json trigger file and return dict.
-    Also accepts npy file.
+    Also accepts npy file and compressed json (format detected from first bytes, see loadfile).
     datadir defaults to h23 file location.
-    TODO: add file lock?
+    Files are replaced atomically by writers, so reading needs no lock.
     """
 
     if filename is None and candname is not None:
@@ -54,18 +288,16 @@ def readfile(filename=None, candname=None, datadir='/home/ubuntu/data/T3'):
     assert os.path.exists(filename), f'candidate json file {filename} not found'
 
     try:
-        with open(filename, 'r') as fp:
-            dd = json.load(fp)
-        return dd
-    except:
-        print('File is not json')
+        dd = loadfile(filename)
+    except (OSError, ValueError, EOFError) as exc:
+        print(f'Could not read {filename}: {exc}')
+        return None
 
-    try:
-        dd = np.load(filename, allow_pickle=True)
+    if isinstance(dd, np.ndarray):
         return dd.tolist()
-    except:
-        print('File is not .npy')
-        return None
+    if isinstance(dd, dict):
+        return _journal.merge(filename, dd)
+    return dd
         
 
 def writefile(dd, candname=None, filename=None, datadir='/home/ubuntu/data/T3'):
@@ -77,47 +309,131 @@ def writefile(dd, candname=None, filename=None, datadir='/home/ubuntu/data/T3'):
 
     assert os.path.exists(filename), f'candidate json file {filename} not found'
 
-    with open(filename, 'w') as fp:
-        json.dump(dd, fp)
+    locking.atomic_write(filename, json.dumps(dd))
+
+    from event import index
+    index.notify(filename)
 
 
-def set_label(label, candname=None, filename=None):
+def _update(fields, candname=None, filename=None, journal=False, datadir='/home/ubuntu/data/T3'):
+    """ Set fields (dict) in candidate json file while holding its file lock.
+    journal=True appends the update to the journal of the file instead of rewriting it.
+    """
+
+    if filename is None and candname is not None:
+        filename = f'{datadir}/{candname}.json'
+    assert os.path.exists(filename), f'candidate json file {filename} not found'
+
+    if journal:
+        _journal.append(filename, fields)
+    else:
+        with locking.lock(Path(filename).stem, Path(filename).parent, timeout=5):
+            dd = readfile(filename=filename)  # includes journal updates
+            assert isinstance(dd, dict), f'could not read candidate json file {filename}'
+            dd.update(fields)
+            writefile(dd, filename=filename)
+            _journal.discard(filename)
+
+    from event import labelstore
+    labelstore.notify(filename, fields)
+
+
+def set_label(label, candname=None, filename=None, journal=False, datadir='/home/ubuntu/data/T3'):
     """ Read, add label, and write candidate json file.
     Can optionally provide full path to file.
     Default assumes name of <candname>.json in cwd.
+    journal=True appends the change to the file journal instead of rewriting the file.
     TODO: decide if file can have more than one candname.
     """
 
     assert label in _allowed, f'label must be in {_allowed}'
 
-    dd = readfile(filename=filename, candname=candname)
-
     if label == 'save':
-        dd[label] = True
+        _update({label: True}, candname=candname, filename=filename, journal=journal, datadir=datadir)
     else:
-        dd['label'] = label
-    writefile(dd, candname=candname, filename=filename)
+        _update({'label': label}, candname=candname, filename=filename, journal=journal, datadir=datadir)
         
         
-def set_notes(notes, candname=None, filename=None):
+def set_notes(notes, candname=None, filename=None, journal=False, datadir='/home/ubuntu/data/T3'):
     """ Read, add notes, and write candidate json file.
     Can optionally provide full path to file.
     Default assumes name of <candname>.json in cwd.
+    journal=True appends the change to the file journal instead of rewriting the file.
     TODO: decide if file can have more than one candname.
     """
 
-    dd = readfile(filename=filename, candname=candname)
-    dd['notes'] = notes
-    writefile(dd, candname=candname, filename=filename)
+    _update({'notes': notes}, candname=candname, filename=filename, journal=journal, datadir=datadir)
 
 
-def set_probability(prob, candname=None, filename=None):
+def set_probability(prob, candname=None, filename=None, journal=False, datadir='/home/ubuntu/data/T3'):
     """ Read, sets probability valuel, and write candidate json file.
     Can optionally provide full path to file.
     Default assumes name of <candname>.json in cwd.
+    journal=True appends the change to the file journal instead of rewriting the file.
     TODO: decide if file can have more than one candname.
     """
 
-    dd = readfile(filename=filename, candname=candname)
-    dd['probability'] = prob
-    writefile(dd, candname=candname, filename=filename)
+    _update({'probability': prob}, candname=candname, filename=filename, journal=journal, datadir=datadir)
+
+
+def _batch_fields(update):
+    """ Convert dict with label, probability and/or notes into fields of candidate json file.
+    """
+
+    fields = {}
+    for key, value in update.items():
+        if key == 'label':
+            assert value in _allowed, f'label must be in {_allowed}'
+            if value == 'save':
+                fields['save'] = True
+            else:
+                fields['label'] = value
+        elif key == 'probability':
+            fields['probability'] = float(value)
+        elif key == 'notes':
+            fields['notes'] = value
+        else:
+            raise ValueError(f'Cannot set {key}. Use label, probability or notes.')
+    return fields
+
+
+def set_batch(updates, workers=8, datadir='/home/ubuntu/data/T3', journal=False):
+    """ Set label, probability and/or notes for many candidates.
+    updates is dict of candname and dict with any of label, probability and notes (or list of (candname, dict)).
+    All updates of a candidate are applied in one locked read/write (or journal append), candidates in parallel.
+    A candidate with an invalid update is not changed.
+    Returns dict of candname and 'ok' or 'error: <reason>'.
+    """
+
+    grouped, errors = {}, {}
+    for candname, update in (updates.items() if isinstance(updates, dict) else updates):
+        try:
+            grouped.setdefault(candname, {}).update(_batch_fields(update))
+        except (AssertionError, ValueError) as exc:
+            errors.setdefault(candname, f'error: {exc}')
+
+    def apply(item):
+        candname, fields = item
+        try:
+            _update(fields, candname=candname, datadir=datadir, journal=journal)
+        except (AssertionError, ValueError, TypeError, OSError) as exc:
+            return candname, f'error: {exc}'
+        return candname, 'ok'
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = dict(pool.map(apply, [item for item in grouped.items() if item[0] not in errors]))
+    results.update(errors)
+    return results
+
+
+def read_batch_csv(csvfile):
+    """ Read csv file with column candname and any of label, probability and notes.
+    Empty cells are ignored. Returns list of (candname, dict) for set_batch.
+    """
+
+    updates = []
+    with open(csvfile, newline='') as fp:
+        for row in csv.DictReader(fp):
+            candname = row.pop('candname').strip()
+            updates.append((candname, {key: value for key, value in row.items() if value not in (None, '')}))
+    return updates
@@ -0,0 +1,139 @@
+import os
+import time
+import sqlite3
+from pathlib import Path
+from event import journal
+
+STORE_NAME = '.labels.sqlite'
+
+_columns = ['label', 'save', 'probability', 'notes']
+
+
+class LabelStore:
+    """ SQLite side-car with label, save, probability and notes of candidates in a json directory.
+    labels.set_label/set_probability/set_notes write through to it when datadir has a store.
+    yymmdd is taken from the candidate name, so date ranges can be queried without opening files.
+    The json files stay canonical. Use reconcile to resynchronize after other edits.
+    """
+
+    def __init__(self, datadir='/home/ubuntu/data/T3', dbfile=None):
+        self.datadir = Path(datadir)
+        self.dbfile = Path(dbfile) if dbfile is not None else self.datadir / STORE_NAME
+        self.con = sqlite3.connect(str(self.dbfile), timeout=30)
+        with self.con:
+            self.con.execute('CREATE TABLE IF NOT EXISTS labels (candname TEXT PRIMARY KEY, yymmdd TEXT, '
+                             'label TEXT, save INTEGER, probability REAL, notes TEXT, updated REAL)')
+            for name in ['yymmdd', 'label', 'probability']:
+                self.con.execute(f'CREATE INDEX IF NOT EXISTS idx_{name} ON labels ({name})')
+
+    def close(self):
+        self.con.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.con.execute('SELECT COUNT(*) FROM labels').fetchone()[0]
+
+    def set(self, candname, fields):
+        """ Set label, save, probability and/or notes of candname from dict fields. Other keys are ignored.
+        """
+
+        fields = {kk: vv for kk, vv in fields.items() if kk in _columns}
+        with self.con:
+            self.con.execute('INSERT OR IGNORE INTO labels (candname, yymmdd) VALUES (?, ?)',
+                             (candname, candname[:6]))
+            if fields:
+                assignments = ', '.join([f'{kk} = ?' for kk in fields])
+                self.con.execute(f'UPDATE labels SET {assignments}, updated = ? WHERE candname = ?',
+                                 list(fields.values()) + [time.time(), candname])
+
+    def get(self, candname):
+        """ Return dict of label, save, probability and notes of candname (None if not in store).
+        """
+
+        row = self.con.execute(f'SELECT {", ".join(_columns)} FROM labels WHERE candname = ?',
+                               (candname,)).fetchone()
+        if row is None:
+            return None
+        dd = dict(zip(_columns, row))
+        dd['save'] = bool(dd['save']) if dd['save'] is not None else None
+        return dd
+
+    def query(self, label=None, unlabeled=False, save=None, prob_min=None, prob_max=None,
+              date_from=None, date_to=None):
+        """ Return sorted list of candnames that match all selections.
+        date_from and date_to are yymmdd strings (inclusive), as in candidate names.
+        """
+
+        conditions, params = [], []
+        if label is not None:
+            conditions.append('label = ?')
+            params.append(label)
+        if unlabeled:
+            conditions.append("(label IS NULL OR label = '')")
+        if save is not None:
+            conditions.append('save = 1' if save else '(save IS NULL OR save = 0)')
+        if prob_min is not None:
+            conditions.append('probability >= ?')
+            params.append(prob_min)
+        if prob_max is not None:
+            conditions.append('probability <= ?')
+            params.append(prob_max)
+        if date_from is not None:
+            conditions.append('yymmdd >= ?')
+            params.append(date_from)
+        if date_to is not None:
+            conditions.append('yymmdd <= ?')
+            params.append(date_to)
+
+        where = f' WHERE {" AND ".join(conditions)}' if conditions else ''
+        return [row[0] for row in self.con.execute(f'SELECT candname FROM labels{where} ORDER BY candname', params)]
+
+    def reconcile(self, workers=8):
+        """ Make store match the json files in datadir (with journals applied).
+        Returns tuple of number of (updated, removed) candidates.
+        """
+
+        from event import labels
+
+        fns = sorted([fn for fn in os.listdir(self.datadir) if fn.endswith('.json')])
+        known = dict((row[0], row[1:]) for row in
+                     self.con.execute(f'SELECT candname, {", ".join(_columns)} FROM labels'))
+
+        rows = []
+        for fn, dd in labels.loadfiles([str(self.datadir / fn) for fn in fns], workers=workers):
+            if not isinstance(dd, dict):
+                continue
+            candname = Path(fn).stem
+            dd = journal.merge(fn, dd)
+            values = tuple(dd.get(name) for name in _columns)
+            values = (values[0], int(values[1]) if values[1] is not None else None) + values[2:]
+            if known.get(candname) != values:
+                rows.append((candname, candname[:6]) + values + (time.time(),))
+
+        candnames = set([Path(fn).stem for fn in fns])
+        removed = [(candname,) for candname in known if candname not in candnames]
+        with self.con:
+            self.con.executemany('INSERT OR REPLACE INTO labels VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+            self.con.executemany('DELETE FROM labels WHERE candname = ?', removed)
+
+        return len(rows), len(removed)
+
+
+def notify(filename, fields):
+    """ Write fields of candidate json file through to the label store of its directory, if there is one.
+    """
+
+    dbfile = Path(filename).parent / STORE_NAME
+    if not dbfile.exists():
+        return
+
+    try:
+        with LabelStore(Path(filename).parent, dbfile=dbfile) as store:
+            store.set(Path(filename).stem, fields)
+    except sqlite3.Error as exc:
+        print(f'Could not update label store {dbfile}: {exc}')
@@ -0,0 +1,104 @@
+import os
+import time
+import fcntl
+import zlib
+import tempfile
+from pathlib import Path
+
+# Advisory file locks for candidate json files.
+# Each trigname (or hashed shard of trignames) has its own lock file in <directory>/.locks,
+# so writers of unrelated candidates do not wait for each other.
+# flock locks belong to the open file, so one FileLock per thread, process or dask worker works the same way.
+
+LOCK_DIR = '.locks'
+
+# os.umask can only be read by setting it, which is not safe in threads, so read it once at import
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+class FileLock:
+    """ Exclusive advisory lock on a file, usable as context manager.
+    Not reentrant: acquiring the same lock twice from one thread will wait for the timeout.
+    """
+
+    def __init__(self, path, timeout=None, poll=0.01):
+        self.path = Path(path)
+        self.timeout = timeout
+        self.poll = poll
+        self.fd = None
+
+    def acquire(self, timeout=None):
+        """ Wait for lock. timeout in seconds (None waits forever). Raises TimeoutError.
+        """
+
+        timeout = timeout if timeout is not None else self.timeout
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+        t0 = time.monotonic()
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if timeout is not None and time.monotonic() - t0 > timeout:
+                    os.close(fd)
+                    raise TimeoutError(f'Could not lock {self.path} in {timeout} s')
+                time.sleep(self.poll)
+        self.fd = fd
+
+    def release(self):
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
+def lock_path(name, directory, nshards=None):
+    """ Path of lock file for name (e.g., trigname) in directory.
+    nshards hashes names into that many lock files instead of one per name.
+    """
+
+    if nshards:
+        name = f'shard{zlib.crc32(name.encode()) % nshards:04d}'
+    return Path(directory) / LOCK_DIR / f'{name}.lock'
+
+
+def lock(name, directory, nshards=None, timeout=None):
+    """ Return FileLock for name (e.g., trigname) in directory.
+    Use as "with locking.lock(trigname, outpath):".
+    """
+
+    return FileLock(lock_path(name, directory, nshards=nshards), timeout=timeout)
+
+
+def atomic_write(fn, data, fsync=False):
+    """ Write str or bytes to fn via temporary file and rename, so readers never see partial file.
+    Keeps the permissions of an existing fn, new files get the default permissions (umask at import).
+    """
+
+    fn = Path(fn)
+    fd, tmp = tempfile.mkstemp(dir=fn.parent, prefix=f'.{fn.name}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb' if isinstance(data, bytes) else 'w') as fp:
+            fp.write(data)
+            if fsync:
+                fp.flush()
+                os.fsync(fp.fileno())
+        try:
+            mode = os.stat(fn).st_mode & 0o777
+        except FileNotFoundError:
+            mode = 0o666 & ~_UMASK
+        os.chmod(tmp, mode)
+        os.replace(tmp, fn)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
@@ -1,52 +1,669 @@
 from astropy import units, coordinates, table
+import numpy as np
 import pickle
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import json
 import os
+import shutil
+import tempfile
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
 
 _install_dir = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'data')
 
+COMPILED_VERSION = 2
+
+# process-level catalog cache: (path, loader) -> (mtime_ns, catalog)
+_cache = {}
+_cache_lock = threading.RLock()
+
+
+def _cached(fn, loader):
+    """ Return loader(fn), loading again only if fn is new or modified since the last load.
+    """
+
+    mtime = os.stat(fn).st_mtime_ns
+    with _cache_lock:
+        if (fn, loader) in _cache and _cache[(fn, loader)][0] == mtime:
+            return _cache[(fn, loader)][1]
+        value = loader(fn)
+        _cache[(fn, loader)] = (mtime, value)
+        return value
+
+
+def _read_nvss(fn):
+    print(f"Loading NVSS catalog {fn}")
+    with open(fn, 'rb') as pkl:
+        catalogn = pickle.load(pkl)
+        fluxesn = pickle.load(pkl)
+    return catalogn, fluxesn
+
+
+def _read_atnf(fn):
+    print(f"Loading ATNF catalog {fn}")
+    tab = table.Table.read(fn, format='ascii')
+    cataloga = coordinates.SkyCoord(ra=tab['RAJ'], dec=tab['DECJ'], unit=(units.hourangle, units.deg))
+    return tab, cataloga
+
+
+def load_nvss(nvsscat='nvss_astropy.pkl', workdir=_install_dir):
+    """ Return (SkyCoord, fluxes) of NVSS catalog, cached per process.
+    """
+
+    return _cached(os.path.join(workdir, nvsscat), _read_nvss)
+
+
+def load_atnf(atnfcat='atnfcat_v1.56.txt', workdir=_install_dir):
+    """ Return (table, SkyCoord) of ATNF catalog, cached per process.
+    """
+
+    return _cached(os.path.join(workdir, atnfcat), _read_atnf)
+
+
+def clear_cache(fn=None):
+    """ Drop cached catalog for file fn (all catalogs if None).
+    """
+
+    global _shared
+    with _cache_lock:
+        _shared = None
+        if fn is None:
+            _cache.clear()
+        else:
+            for key in [key for key in _cache if key[0] == fn]:
+                del _cache[key]
+
+
+def unitvectors(ra, dec):
+    """ Return (N, 3) array of unit vectors for arrays of ra, dec in degrees.
+    """
+
+    ra = np.radians(np.atleast_1d(np.asarray(ra, dtype=float)))
+    dec = np.radians(np.atleast_1d(np.asarray(dec, dtype=float)))
+    cosdec = np.cos(dec)
+    return np.stack([cosdec*np.cos(ra), cosdec*np.sin(ra), np.sin(dec)], axis=-1)
+
+
+def _ball_pairs(tree, xyz, radius, workers=1):
+    """ Return arrays of candidate index and tree index of points within radius (arcsec) of unit vectors xyz.
+    """
+
+    matches = tree.query_ball_point(xyz, r=2*np.sin(np.radians(radius/3600)/2), workers=workers)
+    counts = np.array([len(match) for match in matches], dtype=int)
+    cand = np.repeat(np.arange(len(xyz)), counts)
+    ind = np.concatenate(matches).astype(int) if counts.sum() else np.zeros(0, dtype=int)
+    return cand, ind
+
+
+def _matches(catxyz, xyz, cand, ind, radius):
+    """ Keep candidate/catalog index pairs separated by less than radius (arcsec).
+    Returns arrays of candidate index, catalog index and separation (arcsec), sorted by candidate and separation.
+    """
+
+    dist = np.linalg.norm(catxyz[ind] - xyz[cand], axis=1)
+    keep = dist <= 2*np.sin(np.radians(radius/3600)/2)
+    cand, ind = cand[keep], ind[keep]
+    sep = np.degrees(2*np.arcsin(np.minimum(dist[keep]/2, 1)))*3600
+    order = np.lexsort((sep, cand))
+    return cand[order], ind[order], sep[order]
+
+
+class SkyIndex:
+    """ KD-tree on unit vectors of catalog positions for radius queries of many positions at once.
+    columns is dict of per-source arrays (e.g., flux, dm, name) returned by column().
+    """
+
+    def __init__(self, ra, dec, columns=None):
+        assert cKDTree is not None, "SkyIndex requires scipy"
+        self.xyz = unitvectors(ra, dec)
+        self.tree = cKDTree(self.xyz)
+        self.columns = {'ra': np.radians(ra), 'dec': np.radians(dec)}
+        self.columns.update(columns or {})
+        self.colnames = list(self.columns)
+        self.orig_index = np.arange(len(self.xyz))
+
+    @classmethod
+    def from_skycoord(cls, coord, columns=None):
+        coord = coord.icrs
+        return cls(coord.ra.deg, coord.dec.deg, columns=columns)
+
+    def __len__(self):
+        return len(self.xyz)
+
+    def column(self, name, ind):
+        return np.asarray(self.columns[name])[ind]
+
+    def query_radius(self, ra, dec, radius, workers=1):
+        """ Find all catalog sources within radius (arcsec) of each (ra, dec) in degrees.
+        Returns arrays of candidate index, catalog index and separation (arcsec), sorted by candidate and separation.
+        """
+
+        xyz = unitvectors(ra, dec)
+        cand, ind = _ball_pairs(self.tree, xyz, radius, workers=workers)
+        return _matches(self.xyz, xyz, cand, ind, radius)
+
+
+def compiled_path(catname, workdir=_install_dir):
+    """ Directory of compiled version of catalog file catname.
+    """
+
+    return os.path.join(workdir, os.path.splitext(catname)[0] + '.cat')
+
+
+def _replace_dir(tmppath, outpath):
+    """ Move newly written directory tmppath to outpath, replacing any previous directory there.
+    Files are never overwritten in place, because readers may have them memory-mapped.
+    """
+
+    os.chmod(tmppath, 0o755)
+    parent, base = os.path.split(os.path.abspath(outpath))
+    oldpath = None
+    if os.path.exists(outpath):
+        oldpath = tempfile.mkdtemp(prefix=f'.{base}.old.', dir=parent)
+        os.rename(outpath, os.path.join(oldpath, base))
+    os.rename(tmppath, outpath)
+    if oldpath is not None:
+        shutil.rmtree(oldpath)
+
+
+def build_catalog(catname, workdir=_install_dir, outpath=None):
+    """ Compile NVSS pickle (.pkl) or ATNF text catalog into memory-mappable column files.
+    Rows are stored sorted by declination, with orig_index (source row of each stored row) and its inverse,
+    so indices returned by queries refer to rows of the source catalog. Columns are ra, dec (radians),
+    xyz (unit vectors), flux (NVSS, mJy) or dm and name heap (ATNF).
+    The catalog is written to a new directory that then replaces outpath. Processes that have the old
+    catalog memory-mapped keep reading the old files. Between the two renames, outpath briefly does not
+    exist and lookups fall back to the source catalog.
+    Returns path of compiled catalog.
+    """
+
+    fn = os.path.join(workdir, catname)
+    outpath = outpath if outpath is not None else compiled_path(catname, workdir)
+    if catname.endswith('.pkl'):
+        coord, fluxes = _read_nvss(fn)
+        columns, names = {'flux': np.asarray(fluxes, dtype=float)}, None
+    else:
+        tab, coord = _read_atnf(fn)
+        columns, names = {'dm': np.asarray(tab['DM'], dtype=float)}, np.asarray(tab['PSRJ'])
+    coord = coord.icrs
+    ra, dec = coord.ra.deg, coord.dec.deg
+
+    order = np.argsort(dec, kind='stable')
+    columns.update({'ra': np.radians(ra), 'dec': np.radians(dec), 'xyz': unitvectors(ra, dec)})
+    parent, base = os.path.split(os.path.abspath(outpath))
+    tmppath = tempfile.mkdtemp(prefix=f'.{base}.', dir=parent)
+    for name, values in columns.items():
+        np.save(os.path.join(tmppath, f'{name}.npy'), np.ascontiguousarray(values[order]))
+    np.save(os.path.join(tmppath, 'orig_index.npy'), order.astype('i8'))
+    np.save(os.path.join(tmppath, 'rank.npy'), np.argsort(order).astype('i8'))
+    if names is not None:
+        encoded = [name.encode() for name in names[order]]
+        offsets = np.concatenate([[0], np.cumsum([len(name) for name in encoded])]).astype('i8')
+        np.save(os.path.join(tmppath, 'name.off.npy'), offsets)
+        np.save(os.path.join(tmppath, 'name.heap.npy'), np.frombuffer(b''.join(encoded), dtype='u1'))
+
+    header = {'version': COMPILED_VERSION, 'nrows': len(order), 'source': os.path.abspath(fn),
+              'columns': sorted(columns) + (['name'] if names is not None else [])}
+    with open(os.path.join(tmppath, 'header.json'), 'w') as fp:
+        json.dump(header, fp)
+    _replace_dir(tmppath, outpath)
+    return outpath
+
+
+# CompiledCatalog.query_radius scans declination bands while they hold at most this many sources in total
+BAND_PAIRS = 1000000
+
+
+class CompiledCatalog:
+    """ Memory-mapped catalog written by build_catalog.
+    Radius queries of a few positions scan the declination band around each position, so no tree needs to be
+    built on open. Queries of many positions use a KD-tree of xyz that is built on first use.
+    Indices returned by query_radius and taken by column refer to rows of the source catalog.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'header.json'), 'r') as fp:
+            self.header = json.load(fp)
+        assert self.header['version'] == COMPILED_VERSION, \
+            f"Compiled catalog version {self.header['version']} not supported (rebuild with lookup-build)"
+        self.columns = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')
+                        for name in self.header['columns'] if name != 'name'}
+        if 'name' in self.header['columns']:
+            self.offsets = np.load(os.path.join(path, 'name.off.npy'), mmap_mode='r')
+            self.heap = np.load(os.path.join(path, 'name.heap.npy'), mmap_mode='r')
+        self.orig_index = np.load(os.path.join(path, 'orig_index.npy'), mmap_mode='r')
+        self.rank = np.load(os.path.join(path, 'rank.npy'), mmap_mode='r')
+        self.xyz = self.columns['xyz']
+        self.colnames = self.header['columns']
+        self.tree = None
+        self._tree_lock = threading.Lock()
+
+    def __len__(self):
+        return self.header['nrows']
+
+    def column(self, name, ind):
+        """ Values of column name for source catalog rows ind.
+        """
+
+        rows = self.rank[ind]
+        if name == 'name':
+            return np.array([bytes(self.heap[self.offsets[ii]:self.offsets[ii+1]]).decode()
+                             for ii in np.atleast_1d(rows)], dtype=str)
+        return np.asarray(self.columns[name][rows])
+
+    def _kdtree(self):
+        with self._tree_lock:
+            if self.tree is None:
+                self.tree = cKDTree(np.asarray(self.xyz))
+        return self.tree
+
+    def query_radius(self, ra, dec, radius, workers=1):
+        """ Find all catalog sources within radius (arcsec) of each (ra, dec) in degrees.
+        Same return as SkyIndex.query_radius.
+        If the declination bands of all positions hold more than BAND_PAIRS sources, the KD-tree is used
+        (or, without scipy, the bands are scanned for a chunk of positions at a time).
+        """
+
+        xyz = unitvectors(ra, dec)
+        decs = np.radians(np.atleast_1d(np.asarray(dec, dtype=float)))
+        band = np.radians(radius/3600)
+        lo = np.searchsorted(self.columns['dec'], decs - band)
+        counts = np.searchsorted(self.columns['dec'], decs + band, side='right') - lo
+
+        if counts.sum() > BAND_PAIRS and cKDTree is not None:
+            cand, ind = _ball_pairs(self._kdtree(), xyz, radius, workers=workers)
+            cand, ind, sep = _matches(self.xyz, xyz, cand, ind, radius)
+            return cand, np.asarray(self.orig_index[ind]), sep
+
+        parts, start = [], 0
+        ends = np.cumsum(counts)
+        while start < len(xyz):
+            stop = max(int(np.searchsorted(ends, ends[start] - counts[start] + BAND_PAIRS, side='right')), start + 1)
+            nn = counts[start:stop]
+            cand = np.repeat(np.arange(start, stop), nn)
+            ind = np.arange(nn.sum()) - np.repeat(np.cumsum(nn) - nn, nn) + np.repeat(lo[start:stop], nn)
+            parts.append(_matches(self.xyz, xyz, cand, ind, radius))
+            start = stop
+        if not parts:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0)
+        cand, ind, sep = [np.concatenate(values) for values in zip(*parts)]
+        return cand, np.asarray(self.orig_index[ind]), sep
+
+
+def _compiled(fn):
+    return CompiledCatalog(os.path.dirname(fn))
+
+
+def _nvss_index(fn):
+    coord, fluxes = _cached(fn, _read_nvss)
+    return SkyIndex.from_skycoord(coord, columns={'flux': np.asarray(fluxes, dtype=float)})
+
+
+def _atnf_index(fn):
+    tab, coord = _cached(fn, _read_atnf)
+    return SkyIndex.from_skycoord(coord, columns={'dm': np.asarray(tab['DM'], dtype=float),
+                                                  'name': np.asarray(tab['PSRJ'])})
+
+
+def _index(catname, workdir, loader):
+    header = os.path.join(compiled_path(catname, workdir), 'header.json')
+    if os.path.exists(header):
+        return _cached(header, _compiled)
+    return _cached(os.path.join(workdir, catname), loader)
+
+
+def nvss_index(nvsscat='nvss_astropy.pkl', workdir=_install_dir):
+    """ Return index of NVSS catalog, cached per process.
+    Uses compiled catalog (see build_catalog) if present, else a SkyIndex of the pickled catalog.
+    """
+
+    return _index(nvsscat, workdir, _nvss_index)
+
+
+def atnf_index(atnfcat='atnfcat_v1.56.txt', workdir=_install_dir):
+    """ Return index of ATNF catalog, cached per process.
+    Uses compiled catalog (see build_catalog) if present, else a SkyIndex of the text catalog.
+    """
+
+    return _index(atnfcat, workdir, _atnf_index)
+
+
+def _available(catname, workdir):
+    return os.path.exists(os.path.join(workdir, catname)) or os.path.exists(compiled_path(catname, workdir))
+
+
+def query_nvss(ra, dec, nvss_radius=60, nvss_flux=400, nvsscat='nvss_astropy.pkl', workdir=_install_dir, workers=1):
+    """ Find all NVSS sources brighter than nvss_flux (mJy) within nvss_radius (arcsec) of arrays of ra, dec (deg).
+    Returns structured array with candidate index, catalog index, separation (arcsec) and flux.
+    """
+
+    index = nvss_index(nvsscat, workdir=workdir)
+    cand, ind, sep = index.query_radius(ra, dec, nvss_radius, workers=workers)
+    flux = index.column('flux', ind)
+    keep = flux > nvss_flux
+    matches = np.empty(keep.sum(), dtype=[('cand', 'i8'), ('index', 'i8'), ('sep', 'f8'), ('flux', 'f8')])
+    matches['cand'], matches['index'], matches['sep'], matches['flux'] = cand[keep], ind[keep], sep[keep], flux[keep]
+    return matches
+
+
+def query_atnf(ra, dec, atnf_radius=60, atnfcat='atnfcat_v1.56.txt', workdir=_install_dir, workers=1):
+    """ Find all ATNF pulsars within atnf_radius (arcsec) of arrays of ra, dec (deg).
+    Returns structured array with candidate index, catalog index, separation (arcsec), name and DM.
+    """
+
+    index = atnf_index(atnfcat, workdir=workdir)
+    cand, ind, sep = index.query_radius(ra, dec, atnf_radius, workers=workers)
+    matches = np.empty(len(ind), dtype=[('cand', 'i8'), ('index', 'i8'), ('sep', 'f8'), ('name', 'U12'), ('dm', 'f8')])
+    matches['cand'], matches['index'], matches['sep'] = cand, ind, sep
+    matches['name'] = index.column('name', ind)
+    matches['dm'] = index.column('dm', ind)
+    return matches
+
+
+def warm_cache(nvsscat='nvss_astropy.pkl', atnfcat='atnfcat_v1.56.txt', workdir=_install_dir):
+    """ Open available catalogs and build their indexes, so the first find_associations is fast.
+    Returns list of catalogs loaded.
+    """
+
+    loaded = []
+    for catname, index in [(nvsscat, nvss_index), (atnfcat, atnf_index)]:
+        if _available(catname, workdir):
+            index(catname, workdir=workdir)
+            loaded.append(os.path.join(workdir, catname))
+    return loaded
+
+
+def _skycoord(index, ind):
+    return coordinates.SkyCoord(ra=index.column('ra', ind), dec=index.column('dec', ind), unit='rad')
+
 
 def find_associations(ra, dec, mode='both', nvss_radius=60, nvss_flux=400, atnf_radius=60,
-                      nvsscat='nvss_astropy.pkl', atnfcat='atnfcat_v1.56.txt', workdir=_install_dir):
+                      nvsscat='nvss_astropy.pkl', atnfcat='atnfcat_v1.56.txt', workdir=_install_dir,
+                      dm=None, min_score=0.1):
     """ Find cataloged NVSS/pulsar sources near (RA, Dec) in degrees.
     Major check is for bright NVSS sources during VLASS (mode='nvss')
     For mode='pulsar', it will return any pulsar in atnf catalog.
     nvss_radius (arcsec), nvss_flux (mJy), atnf_radius (arcsec) define cross match.
-    Returns boolean (for now)
+    If candidate dm is given, the pulsar association is the best match of score_pulsars with score >= min_score,
+    with the score appended.
+    Catalogs are opened once per process (see nvss_index, atnf_index, build_catalog, clear_cache).
+    Returns list of nearest association per catalog (separation in degrees), or None if a catalog is missing.
     """
 
     assert mode.lower() in ['pulsar', 'nvss', 'both']
 
-    if os.path.exists(os.path.join(workdir, nvsscat)) and mode.lower() in ['nvss', 'both']:
-        print("Loading NVSS catalog")
-        with open(os.path.join(workdir, nvsscat), 'rb') as pkl:
-            catalogn = pickle.load(pkl)
-            fluxesn = pickle.load(pkl)
-    else:
-        print(f"No catalog found for mode {mode} in {workdir}")
-        return None
+    for catname, modes in [(nvsscat, ['nvss', 'both']), (atnfcat, ['pulsar', 'both'])]:
+        if mode.lower() in modes and not _available(catname, workdir):
+            print(f"No catalog found for mode {mode} in {workdir}")
+            return None
 
-    if os.path.exists(os.path.join(workdir, atnfcat)) and mode.lower() in ['pulsar', 'both']:
-        print("Loading ATNF catalog")
-        tab = table.Table.read(os.path.join(workdir, atnfcat), format='ascii')
-        cataloga = coordinates.SkyCoord(ra=tab['RAJ'], dec=tab['DECJ'], unit=(units.hourangle, units.deg))
-    else:
-        print(f"No catalog found for mode {mode} in {workdir}")
-        return None
-
-    coord = coordinates.SkyCoord(ra, dec, unit='deg')
     associations = []
 
     if mode.lower() in ['nvss', 'both']:
-        print("Comparing SkyCoord for candidates to NVSS.")
-        ind, sep2, sep3 = coord.match_to_catalog_sky(catalogn)
-        if sep2 < nvss_radius*units.arcsec and fluxesn[ind] > nvss_flux:
-            associations.append(['nvss', catalogn[ind], sep2.value, fluxesn[ind]])
+        matches = query_nvss(ra, dec, nvss_radius=nvss_radius, nvss_flux=nvss_flux, nvsscat=nvsscat, workdir=workdir)
+        if len(matches):
+            match = matches[0]
+            coord = _skycoord(nvss_index(nvsscat, workdir=workdir), match['index'])
+            associations.append(['nvss', coord, match['sep']/3600, match['flux']])
 
     if mode.lower() in ['pulsar', 'both']:
-        print("Comparing SkyCoord for candidates to ATNF.")
-        ind, sep2, sep3 = coord.match_to_catalog_sky(cataloga)
-        if sep2 < atnf_radius*units.arcsec:
-            name, dm = tab[ind][['PSRJ', 'DM']]
-            associations.append(['atnf', cataloga[ind], sep2.value, name, dm])
+        if dm is None:
+            matches = query_atnf(ra, dec, atnf_radius=atnf_radius, atnfcat=atnfcat, workdir=workdir)
+        else:
+            matches = score_pulsars(ra, dec, dm, atnf_radius=atnf_radius, atnfcat=atnfcat, workdir=workdir)
+            matches = matches[matches['score'] >= min_score]
+        if len(matches):
+            match = matches[0]
+            coord = _skycoord(atnf_index(atnfcat, workdir=workdir), match['index'])
+            association = ['atnf', coord, match['sep']/3600, match['name'], match['dm']]
+            if dm is not None:
+                association.append(match['score'])
+            associations.append(association)
+
+    return associations
+
+
+ASSOCIATION_DTYPE = [('cand', 'i8'), ('catalog', 'U16'), ('index', 'i8'), ('sep', 'f8'), ('flux', 'f8'), ('dm', 'f8'),
+                     ('name', 'U24')]
+
+
+def _associations_chunk(ra, dec, start, mode, nvss_radius, nvss_flux, atnf_radius, nvsscat, atnfcat, workdir):
+    parts = []
+    if mode in ['nvss', 'both']:
+        matches = query_nvss(ra, dec, nvss_radius=nvss_radius, nvss_flux=nvss_flux, nvsscat=nvsscat, workdir=workdir)
+        part = np.zeros(len(matches), dtype=ASSOCIATION_DTYPE)
+        part['catalog'], part['dm'] = 'nvss', np.nan
+        for name in ['cand', 'index', 'sep', 'flux']:
+            part[name] = matches[name]
+        parts.append(part)
+    if mode in ['pulsar', 'both']:
+        matches = query_atnf(ra, dec, atnf_radius=atnf_radius, atnfcat=atnfcat, workdir=workdir)
+        part = np.zeros(len(matches), dtype=ASSOCIATION_DTYPE)
+        part['catalog'], part['flux'] = 'atnf', np.nan
+        for name in ['cand', 'index', 'sep', 'name', 'dm']:
+            part[name] = matches[name]
+        parts.append(part)
 
+    associations = np.concatenate(parts)
+    associations['cand'] += start
     return associations
+
+
+def find_associations_batch(ra, dec, mode='both', nvss_radius=60, nvss_flux=400, atnf_radius=60,
+                            nvsscat='nvss_astropy.pkl', atnfcat='atnfcat_v1.56.txt', workdir=_install_dir,
+                            workers=1, chunksize=100000):
+    """ Find all cataloged NVSS/pulsar sources near arrays of (RA, Dec) in degrees.
+    Same selection as find_associations, but every match within the radius is returned.
+    Positions are queried in chunks of chunksize, with workers threads sharing the cached catalog indexes.
+    Returns structured array (see ASSOCIATION_DTYPE) with candidate index, catalog ('nvss' or 'atnf'),
+    catalog index, separation (arcsec), flux (mJy, NaN for atnf), DM (NaN for nvss) and name,
+    sorted by candidate, catalog and separation. Returns None if a catalog is missing.
+    """
+
+    assert mode.lower() in ['pulsar', 'nvss', 'both']
+    mode = mode.lower()
+
+    for catname, modes in [(nvsscat, ['nvss', 'both']), (atnfcat, ['pulsar', 'both'])]:
+        if mode in modes and not _available(catname, workdir):
+            print(f"No catalog found for mode {mode} in {workdir}")
+            return None
+
+    ra = np.atleast_1d(np.asarray(ra, dtype=float))
+    dec = np.atleast_1d(np.asarray(dec, dtype=float))
+    assert ra.shape == dec.shape, "ra and dec must have same shape"
+    # build indexes once before threads share them
+    if mode in ['nvss', 'both']:
+        nvss_index(nvsscat, workdir=workdir)
+    if mode in ['pulsar', 'both']:
+        atnf_index(atnfcat, workdir=workdir)
+
+    starts = range(0, max(len(ra), 1), chunksize)
+    args = (mode, nvss_radius, nvss_flux, atnf_radius, nvsscat, atnfcat, workdir)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        chunks = list(pool.map(lambda start: _associations_chunk(ra[start:start+chunksize], dec[start:start+chunksize],
+                                                                 start, *args), starts))
+    associations = np.concatenate(chunks)
+    return associations[np.lexsort((associations['sep'], associations['catalog'], associations['cand']))]
+
+
+def score_pulsars(ra, dec, dm, atnf_radius=600, sep_sigma=60, dm_frac=0.1, dm_min=2,
+                  atnfcat='atnfcat_v1.56.txt', workdir=_install_dir, workers=1):
+    """ Score ATNF pulsars near candidates jointly on angular separation and DM difference.
+    ra, dec (deg) and dm (pc/cm3) are scalars or arrays. Every pulsar within atnf_radius (arcsec) is scored:
+    score = exp(-((sep/sep_sigma)**2 + (ddm/dm_sigma)**2)/2), with dm_sigma = max(dm_frac*pulsar dm, dm_min).
+    Returns structured array with candidate index, catalog index, separation (arcsec), name, dm, ddm and score,
+    sorted by candidate and descending score.
+    """
+
+    dm = np.atleast_1d(np.asarray(dm, dtype=float))
+    matches = query_atnf(ra, dec, atnf_radius=atnf_radius, atnfcat=atnfcat, workdir=workdir, workers=workers)
+    ddm = dm[matches['cand']] - matches['dm']
+    dm_sigma = np.maximum(dm_frac*matches['dm'], dm_min)
+    score = np.exp(-((matches['sep']/sep_sigma)**2 + (ddm/dm_sigma)**2)/2)
+
+    scored = np.empty(len(matches), dtype=matches.dtype.descr + [('ddm', 'f8'), ('score', 'f8')])
+    for name in matches.dtype.names:
+        scored[name] = matches[name]
+    scored['ddm'], scored['score'] = ddm, score
+    return scored[np.lexsort((-score, scored['cand']))]
+
+
+def pulsar_veto(ra, dec, dm, min_score=0.1, **kwargs):
+    """ Flag candidates that are likely known pulsars (best score_pulsars score >= min_score).
+    kwargs are passed to score_pulsars.
+    Returns boolean array and structured array of best match per candidate (index -1 and score 0 if none).
+    """
+
+    ncand = len(np.atleast_1d(ra))
+    scored = score_pulsars(ra, dec, dm, **kwargs)
+    best = np.zeros(ncand, dtype=scored.dtype)
+    best['cand'], best['index'] = np.arange(ncand), -1
+    best['sep'] = best['dm'] = best['ddm'] = np.nan
+    cands, first = np.unique(scored['cand'], return_index=True)
+    best[cands] = scored[first]
+    return best['score'] >= min_score, best
+
+
+# registered catalogs: name -> (source, radius, select)
+_registry = {}
+_shared = None
+
+
+def register_catalog(name, source, radius=60, select=None):
+    """ Register catalog for cross_match.
+    source is a catalog (object with xyz, orig_index and column(name, ind), e.g. SkyIndex or CompiledCatalog) or a
+    callable returning one (or None if unavailable). Callables are called at each cross_match, so cached sources
+    pick up catalog file changes. radius (arcsec) is the match radius for this catalog.
+    select(catalog, ind) optionally returns boolean array of catalog rows ind to include (e.g., a flux cut).
+    It is applied once when the shared index is built, so rejected rows are not indexed.
+    A SkyIndex of known FRB repeaters or of DSA-110 events (columns name, dm) can be registered the same way.
+    """
+
+    global _shared
+    with _cache_lock:
+        _registry[name] = (source, radius, select)
+        _shared = None
+
+
+def unregister_catalog(name):
+    global _shared
+    with _cache_lock:
+        _registry.pop(name, None)
+        _shared = None
+
+
+def registered_catalogs():
+    return list(_registry)
+
+
+def _default_source(catname, index):
+    return lambda: index(catname) if _available(catname, _install_dir) else None
+
+
+register_catalog('nvss', _default_source('nvss_astropy.pkl', nvss_index), radius=60,
+                 select=lambda catalog, ind: catalog.column('flux', ind) > 400)
+register_catalog('atnf', _default_source('atnfcat_v1.56.txt', atnf_index), radius=60)
+
+
+class SharedIndex:
+    """ One KD-tree over the unit vectors of several catalogs, each with its own match radius and selection.
+    entries is list of (name, catalog, radius, select). Rows rejected by select are not put in the tree.
+    """
+
+    def __init__(self, entries):
+        assert cKDTree is not None, "SharedIndex requires scipy"
+        self.entries = entries
+        rows, xyz = [], []
+        for name, catalog, radius, select in entries:
+            orig = np.asarray(catalog.orig_index)  # source rows in order of catalog.xyz
+            keep = np.asarray(select(catalog, orig), dtype=bool) if select is not None else np.ones(len(orig), dtype=bool)
+            rows.append(orig[keep])
+            xyz.append(np.asarray(catalog.xyz)[keep])
+        self.rows = np.concatenate(rows).astype(int) if entries else np.zeros(0, dtype=int)
+        self.catid = np.repeat(np.arange(len(entries)), [len(rr) for rr in rows]).astype(int)
+        self.radii = np.array([radius for _, _, radius, _ in entries], dtype=float)
+        self.xyz = np.concatenate(xyz) if entries else np.zeros((0, 3))
+        self.tree = cKDTree(self.xyz)
+
+    def query(self, ra, dec, workers=1):
+        """ Find matches in all catalogs for arrays of ra, dec (deg).
+        Returns structured array (see ASSOCIATION_DTYPE) sorted by candidate, catalog and separation.
+        """
+
+        xyz = unitvectors(ra, dec)
+        if not len(self.entries):
+            return np.zeros(0, dtype=ASSOCIATION_DTYPE)
+        radius = self.radii.max()
+        matches = self.tree.query_ball_point(xyz, r=2*np.sin(np.radians(radius/3600)/2), workers=workers)
+        counts = np.array([len(match) for match in matches], dtype=int)
+        cand = np.repeat(np.arange(len(xyz)), counts)
+        ind = np.concatenate(matches).astype(int) if counts.sum() else np.zeros(0, dtype=int)
+        cand, ind, sep = _matches(self.xyz, xyz, cand, ind, radius)
+        keep = sep <= self.radii[self.catid[ind]]
+        cand, ind, sep = cand[keep], ind[keep], sep[keep]
+
+        parts = []
+        for ii, (name, catalog, radius, select) in enumerate(self.entries):
+            incat = self.catid[ind] == ii
+            local = self.rows[ind[incat]]
+            part = np.zeros(len(local), dtype=ASSOCIATION_DTYPE)
+            part['cand'], part['catalog'], part['index'], part['sep'] = cand[incat], name, local, sep[incat]
+            part['flux'] = part['dm'] = np.nan
+            for colname in ['flux', 'dm', 'name']:
+                if colname in catalog.colnames and len(local):
+                    part[colname] = catalog.column(colname, local)
+            parts.append(part)
+
+        associations = np.concatenate(parts)
+        return associations[np.lexsort((associations['sep'], associations['catalog'], associations['cand']))]
+
+
+def shared_index(catalogs=None):
+    """ Return SharedIndex of registered catalogs (all if catalogs is None), rebuilt only when a catalog changes.
+    """
+
+    global _shared
+    with _cache_lock:
+        entries = []
+        for name in (catalogs if catalogs is not None else list(_registry)):
+            source, radius, select = _registry[name]
+            catalog = source() if callable(source) else source
+            if catalog is None:
+                print(f"Catalog {name} not available")
+                continue
+            entries.append((name, catalog, radius, select))
+        key = [(name, id(catalog), radius) for name, catalog, radius, _ in entries]
+        if _shared is None or _shared[0] != key:
+            _shared = (key, SharedIndex(entries))
+        return _shared[1]
+
+
+def cross_match(ra, dec, catalogs=None, workers=1, chunksize=100000):
+    """ Cross-match candidate position(s) in degrees against registered catalogs in one pass over a shared index.
+    Each catalog uses its registered radius and selection. Positions are queried in chunks on workers threads.
+    Returns structured array (see ASSOCIATION_DTYPE) with candidate index, catalog name, catalog index,
+    separation (arcsec), flux, DM and name (NaN or empty where the catalog has no such column).
+    """
+
+    index = shared_index(catalogs)
+    ra = np.atleast_1d(np.asarray(ra, dtype=float))
+    dec = np.atleast_1d(np.asarray(dec, dtype=float))
+    assert ra.shape == dec.shape, "ra and dec must have same shape"
+
+    def query(start):
+        part = index.query(ra[start:start+chunksize], dec[start:start+chunksize])
+        part['cand'] += start
+        return part
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        chunks = list(pool.map(query, range(0, max(len(ra), 1), chunksize)))
+    return np.concatenate(chunks)
+
+
+if os.environ.get('DSAEVENT_WARM_LOOKUP'):
+    warm_cache()
@@ -0,0 +1,77 @@
+import json
+from pathlib import Path
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from event import event, locking
+
+
+def migrate_file(fn, dry_run=False):
+    """ Rewrite trigger json file in current format with schema_version.
+    Converts obsolete {trigname: {...}} files and adds schema_version to current ones.
+    Other keys are kept as they are.
+    Returns tuple of (fn, status) with status 'current', 'legacy', 'unversioned' or 'error: <reason>'.
+    dry_run=True reports status without writing.
+    """
+
+    fn = str(fn)
+    try:
+        with locking.lock(Path(fn).stem, Path(fn).parent, timeout=5):
+            with open(fn) as fp:
+                dd = json.load(fp)
+            if not isinstance(dd, dict) or not dd:
+                return fn, 'error: not a trigger dict'
+            if dd.get('schema_version') == event.SCHEMA_VERSION:
+                return fn, 'current'
+
+            status = 'legacy' if ('schema_version' not in dd and len(dd) == 1) else 'unversioned'
+            dd = dict(event.trigger_dict(dd))
+            if not isinstance(dd.get('trigname'), str):
+                return fn, 'error: no trigname'
+            dd['schema_version'] = event.SCHEMA_VERSION
+
+            if not dry_run:
+                locking.atomic_write(fn, json.dumps(dd, ensure_ascii=False, indent=4))
+    except (OSError, ValueError, TypeError, AttributeError) as exc:
+        return fn, f'error: {type(exc).__name__}: {exc}'
+
+    return fn, status
+
+
+def _migrate_files(fns, dry_run):
+    return [migrate_file(fn, dry_run=dry_run) for fn in fns]
+
+
+def migrate(paths, dry_run=False, workers=1, chunksize=64, progress=1000):
+    """ Migrate many trigger json files, in parallel for workers > 1.
+    Prints progress every progress files. Returns dict of fn and status (see migrate_file).
+    """
+
+    paths = [str(fn) for fn in paths]
+    chunks = [paths[ii:ii+chunksize] for ii in range(0, len(paths), chunksize)]
+
+    if workers is None or workers <= 1:
+        done = map(_migrate_files, chunks, [dry_run]*len(chunks))
+        results = _collect(done, len(paths), progress)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            done = executor.map(_migrate_files, chunks, [dry_run]*len(chunks))
+            results = _collect(done, len(paths), progress)
+
+    return results
+
+
+def _collect(chunks, total, progress):
+    results = {}
+    for chunk in chunks:
+        last = len(results)
+        results.update(chunk)
+        if progress and (len(results)//progress > last//progress or len(results) == total):
+            print(f'Migrated {len(results)}/{total} files')
+    return results
+
+
+def summary(results):
+    """ Count statuses returned by migrate. Errors are counted together.
+    """
+
+    return Counter(['error' if status.startswith('error') else status for status in results.values()])
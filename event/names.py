@@ -1,35 +1,171 @@
+import os
+import json
 import string
 import datetime
-from astropy import time
 import random
+import threading
+import numpy as np
+from pathlib import Path
+from event import locking
 
-def get_lastname():
+# proleptic Gregorian ordinal of MJD 0 (1858-11-17)
+_MJD0 = datetime.date(1858, 11, 17).toordinal()
+
+TRIGGER_KEY = '/mon/corr/1/trigger'
+
+
+class EtcdBackend:
+    """ Key-value backend on etcd with dsautils.
+    """
+
+    def __init__(self):
+        from dsautils import dsa_store
+        self.ds = dsa_store.DsaStore()
+
+    def get(self, key):
+        return self.ds.get_dict(key)
+
+    def watch(self, key, callback):
+        """ Call callback with new value (dict) whenever key changes. Returns True if watching.
+        """
+
+        self.ds.add_watch(key, callback)
+        return True
+
+
+class MemoryBackend:
+    """ In-process stand-in for etcd, for tests and benchmarks.
+    """
+
+    def __init__(self, data=None):
+        self.data = dict(data) if data is not None else {}
+        self.callbacks = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def put(self, key, value):
+        self.data[key] = value
+        for callback in self.callbacks.get(key, []):
+            callback(value)
+
+    def watch(self, key, callback):
+        self.callbacks.setdefault(key, []).append(callback)
+        return True
+
+
+class FileBackend:
+    """ Stand-in for etcd with a json file of keys and values, shared between processes.
+    Cannot push changes, so readers check the file mtime on each get.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.mtime = None
+        self.data = {}
+
+    def get(self, key):
+        if not self.path.exists():
+            return None
+        stat = self.path.stat()
+        mtime = (stat.st_mtime_ns, stat.st_ino)  # put replaces the file, so inode changes too
+        if mtime != self.mtime:
+            with open(self.path) as fp:
+                self.data = json.load(fp)
+            self.mtime = mtime
+        return self.data.get(key)
+
+    def put(self, key, value):
+        with locking.lock(self.path.stem, self.path.parent, timeout=5):
+            data = {}
+            if self.path.exists():
+                with open(self.path) as fp:
+                    data = json.load(fp)
+            data[key] = value
+            locking.atomic_write(self.path, json.dumps(data))
+
+    def watch(self, key, callback):
+        return False
+
+
+class LastNameCache:
+    """ Keeps name of last triggered candidate in memory.
+    Subscribes to changes of the trigger key where the backend supports it, otherwise reads the backend on each get.
+    """
+
+    def __init__(self, backend=None, key=TRIGGER_KEY):
+        self.backend = backend if backend is not None else EtcdBackend()
+        self.key = key
+        self.lastname = self._read()
+        try:
+            self.watching = self.backend.watch(key, self._update)
+        except Exception as exc:
+            print(f'Could not watch {key}: {exc}')
+            self.watching = False
+
+    def _read(self):
+        try:
+            return self._name(self.backend.get(self.key))
+        except Exception:
+            return None
+
+    def _name(self, value):
+        # trigger value is dict with the candidate name as (last) key
+        if not value:
+            return None
+        return list(value)[-1]
+
+    def _update(self, value):
+        self.lastname = self._name(value)
+
+    def get(self):
+        if not self.watching:
+            self.lastname = self._read()
+        return self.lastname
+
+
+_lastname_cache = None
+
+
+def get_lastname(cache=None):
     """ Look at etcd to get name of last triggered candidate
     Return of None means that the name generation should start anew.
+    Uses a process-wide LastNameCache that watches etcd, unless cache (LastNameCache) is given.
     """
 
-    from dsautils import dsa_store
-    ds = dsa_store.DsaStore()
+    global _lastname_cache
+    if cache is None:
+        if _lastname_cache is None:
+            _lastname_cache = LastNameCache()
+        cache = _lastname_cache
 
-    try:
-        lastname, vv = ds.get_dict('/mon/corr/1/trigger').popitem()
-    except:
-        lastname = None
-        
-    return lastname
+    return cache.get()
 
 
-def increment_name(mjd, lastname=None, suffixlength=4):
-    """ Use mjd to create unique name for event.
+def mjd_to_yymmdd(mjd):
+    """ Get yymmdd string of the UTC day of mjd.
     """
 
+    dt = datetime.date.fromordinal(_MJD0 + int(mjd // 1))
+    return f'{dt.year % 100:02d}{dt.month:02d}{dt.day:02d}'
 
-    dt = time.Time(mjd, format='mjd', scale='utc').to_datetime()
-    print(f'Incrementing {lastname} at MJD={mjd} or {dt}')
-    newname = lastname
-    while newname == lastname:
-        suffix = ''.join(random.choices(string.ascii_lowercase, k=suffixlength))
-        newname = f'{str(dt.year)[2:]}{dt.month:02d}{dt.day:02d}{suffix}'
+
+def increment_name(mjd, lastname=None, suffixlength=4, allocator=None):
+    """ Use mjd to create unique name for event.
+    allocator (NameAllocator) guarantees that names are unique for the day, not only different from lastname.
+    """
+
+    yymmdd = mjd_to_yymmdd(mjd)
+    print(f'Incrementing {lastname} at MJD={mjd} or {yymmdd}')
+    if allocator is not None:
+        if lastname is not None:
+            allocator.reserve(lastname)
+        newname = allocator.allocate(mjd)
+    else:
+        newname = lastname
+        while newname == lastname:
+            suffix = ''.join(random.choices(string.ascii_lowercase, k=suffixlength))
+            newname = f'{yymmdd}{suffix}'
 
     #if lastname is None:  # generate new name for this yymmdd
     #    suffix = string.ascii_lowercase[0]*suffixlength
@@ -50,6 +186,101 @@ def increment_name(mjd, lastname=None, suffixlength=4):
 
     return newname
 
+class NameAllocator:
+    """ Hands out names yymmdd+suffix that are unique for each day.
+    Suffixes are a fixed permutation of a per-day counter, so they look random but do not repeat.
+    With statedir, used names are appended to <statedir>/<yymmdd>.names under a file lock,
+    so several trigger processes can share one allocator state. Otherwise names are unique within the process.
+    """
+
+    _multiplier = 104729  # prime, so coprime with 26**suffixlength
+
+    def __init__(self, statedir=None, suffixlength=4):
+        self.statedir = Path(statedir) if statedir is not None else None
+        self.suffixlength = suffixlength
+        self.size = 26**suffixlength
+        self.used = {}
+        self.offsets = {}
+        self.lock = threading.Lock()
+        if self.statedir is not None:
+            self.statedir.mkdir(parents=True, exist_ok=True)
+
+    def _suffix(self, count):
+        number = (count*self._multiplier + 12345) % self.size
+        return f'{numbertosuffix(number):a>{self.suffixlength}}'
+
+    def _load(self, yymmdd):
+        """ Read names appended to state file by other processes since last read.
+        """
+
+        used = self.used.setdefault(yymmdd, set())
+        fn = self.statedir / f'{yymmdd}.names'
+        if not fn.exists():
+            return
+        with open(fn, 'rb') as fp:
+            fp.seek(self.offsets.get(yymmdd, 0))
+            data = fp.read()
+        end = data.rfind(b'\n') + 1
+        used.update(data[:end].decode().split())
+        self.offsets[yymmdd] = self.offsets.get(yymmdd, 0) + end
+
+    def _save(self, yymmdd, name):
+        fd = os.open(self.statedir / f'{yymmdd}.names', os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+        try:
+            os.write(fd, f'{name}\n'.encode())
+        finally:
+            os.close(fd)
+
+    def _next(self, yymmdd):
+        used = self.used.setdefault(yymmdd, set())
+        assert len(used) < self.size, f'All {self.size} names for {yymmdd} are used'
+        count = len(used)
+        name = f'{yymmdd}{self._suffix(count)}'
+        while name in used:
+            count += 1
+            name = f'{yymmdd}{self._suffix(count)}'
+        used.add(name)
+        return name
+
+    def _locked(self, yymmdd, func):
+        with self.lock:
+            if self.statedir is None:
+                return func()
+            with locking.lock(yymmdd, self.statedir, timeout=10):
+                self._load(yymmdd)
+                return func()
+
+    def allocate(self, mjd):
+        """ Return new unique name for day of mjd.
+        """
+
+        yymmdd = mjd_to_yymmdd(mjd)
+
+        def allocate():
+            name = self._next(yymmdd)
+            if self.statedir is not None:
+                self._save(yymmdd, name)
+            return name
+
+        return self._locked(yymmdd, allocate)
+
+    def reserve(self, name):
+        """ Mark an existing name (e.g., from etcd or T3 files) as used. Injection suffix "_inj" is ignored.
+        """
+
+        name = name.split('_inj')[0]
+        yymmdd = name[:6]
+
+        def reserve():
+            used = self.used.setdefault(yymmdd, set())
+            if name not in used:
+                used.add(name)
+                if self.statedir is not None:
+                    self._save(yymmdd, name)
+
+        self._locked(yymmdd, reserve)
+
+
 def suffixtonumber(suffix):
     """ Given a set of ascii_lowercase values, get a base 26 number.
     a = 0, ... z = 25, aa = 26, ...
@@ -66,3 +297,118 @@ def numbertosuffix(num, base=26, numerals=string.ascii_lowercase):
     """
 
     return ((num == 0) and numerals[0]) or (numbertosuffix(num // base, base, numerals).lstrip(numerals[0]) + numerals[num % base])
+
+
+def suffixes_to_numbers(suffixes):
+    """ Vectorized suffixtonumber for an array of ascii_lowercase suffixes (may differ in length).
+    """
+
+    codes = np.atleast_1d(np.asarray(suffixes, dtype='S'))
+    width = codes.dtype.itemsize
+    codes = codes.view('u1').reshape(len(codes), width).astype('i8')
+    numbers = np.zeros(len(codes), dtype='i8')
+    for col in range(width):
+        valid = codes[:, col] > 0  # shorter suffixes are padded with zero bytes
+        numbers = np.where(valid, numbers*26 + codes[:, col] - ord('a'), numbers)
+    return numbers
+
+
+def numbers_to_suffixes(numbers, suffixlength=4):
+    """ Vectorized inverse of suffixes_to_numbers, with suffixes padded with "a" to suffixlength.
+    """
+
+    numbers = np.atleast_1d(np.asarray(numbers, dtype='i8'))
+    assert np.all((numbers >= 0) & (numbers < 26**suffixlength)), f'numbers must fit in {suffixlength} letters'
+    codes = np.empty((len(numbers), suffixlength), dtype='u1')
+    for col in range(suffixlength - 1, -1, -1):
+        numbers, digit = np.divmod(numbers, 26)
+        codes[:, col] = digit + ord('a')
+    return codes.view(f'S{suffixlength}').ravel().astype('U')
+
+
+def split_names(names, suffixlength=4):
+    """ Split array of names like yymmddxxxx or yymmddxxxx_inj.
+    Returns arrays of yymmdd (int), suffix number and injection flag.
+    """
+
+    arr = np.atleast_1d(np.asarray(names, dtype='S'))
+    width = max(arr.dtype.itemsize, 6 + suffixlength + 4)
+    codes = arr.astype(f'S{width}').view('u1').reshape(len(arr), width)
+
+    digits = codes[:, :6].astype('i8') - ord('0')
+    assert np.all((digits >= 0) & (digits <= 9)), 'names must start with yymmdd'
+    yymmdd = digits @ (10**np.arange(5, -1, -1))
+
+    letters = codes[:, 6:6+suffixlength].astype('i8') - ord('a')
+    assert np.all((letters >= 0) & (letters < 26)), f'names must have {suffixlength} letter suffix'
+    numbers = letters @ (26**np.arange(suffixlength - 1, -1, -1))
+
+    injected = np.all(codes[:, 6+suffixlength:6+suffixlength+4] == np.frombuffer(b'_inj', dtype='u1'), axis=1)
+    return yymmdd, numbers, injected
+
+
+def join_names(yymmdd, numbers, injected, suffixlength=4):
+    """ Inverse of split_names.
+    """
+
+    days = np.char.zfill(np.asarray(yymmdd).astype(str), 6)
+    names = np.char.add(days, numbers_to_suffixes(numbers, suffixlength=suffixlength))
+    return np.char.add(names, np.where(injected, '_inj', ''))
+
+
+class NameIndex:
+    """ Sorted, de-duplicated set of candidate names.
+    Names are stored as sorted int64 keys (day, suffix number, injection flag), so the names of a day or
+    range of days are one slice found with searchsorted, and membership tests are NumPy operations.
+    """
+
+    def __init__(self, names=(), suffixlength=4):
+        self.suffixlength = suffixlength
+        self.size = 2*26**suffixlength
+        self.keys = np.zeros(0, dtype='i8')
+        self.add(names)
+
+    def _keys(self, names):
+        if not len(names):
+            return np.zeros(0, dtype='i8')
+        yymmdd, numbers, injected = split_names(names, suffixlength=self.suffixlength)
+        return yymmdd*self.size + numbers*2 + injected
+
+    def _names(self, keys):
+        if not len(keys):
+            return np.zeros(0, dtype='U1')
+        days, rem = np.divmod(keys, self.size)
+        return join_names(days, rem//2, rem % 2 == 1, suffixlength=self.suffixlength)
+
+    def add(self, names):
+        """ Add array of names.
+        """
+
+        self.keys = np.union1d(self.keys, self._keys(names))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, name):
+        key = self._keys([name])[0]
+        ii = np.searchsorted(self.keys, key)
+        return ii < len(self.keys) and self.keys[ii] == key
+
+    def names(self):
+        """ Return sorted array of all names.
+        """
+
+        return self._names(self.keys)
+
+    def range(self, start, end):
+        """ Return sorted array of names with yymmdd in [start, end] (ints or yymmdd strings).
+        """
+
+        lo, hi = np.searchsorted(self.keys, [int(start)*self.size, (int(end) + 1)*self.size])
+        return self._names(self.keys[lo:hi])
+
+    def day(self, yymmdd):
+        """ Return sorted array of names of one day.
+        """
+
+        return self.range(yymmdd, yymmdd)
@@ -0,0 +1,260 @@
+import json
+import math
+import os
+import tempfile
+import numpy as np
+from event import lookup
+
+SKYMASK_VERSION = 1
+
+
+def nside2npix(nside):
+    return 12*nside*nside
+
+
+def nside2resol(nside):
+    """ Approximate pixel size (radians).
+    """
+
+    return np.sqrt(4*np.pi/nside2npix(nside))
+
+
+def _zphi2pix(nside, z, phi):
+    """ HEALPix RING pixel of z = cos(colatitude) and longitude phi (radians).
+    """
+
+    za = np.abs(z)
+    tt = np.mod(phi, 2*np.pi)/(np.pi/2)  # in [0, 4)
+    tt = np.where(tt >= 4, 0., tt)
+    ncap = 2*nside*(nside - 1)
+    npix = nside2npix(nside)
+    pix = np.zeros(z.shape, dtype='i8')
+
+    eq = za <= 2/3
+    temp1 = nside*(0.5 + tt[eq])
+    temp2 = nside*z[eq]*0.75
+    jp = (temp1 - temp2).astype('i8')
+    jm = (temp1 + temp2).astype('i8')
+    ir = nside + 1 + jp - jm  # ring number counted from z = 2/3
+    kshift = 1 - (ir & 1)
+    ip = np.mod((jp + jm - nside + kshift + 1)//2, 4*nside)
+    pix[eq] = ncap + (ir - 1)*4*nside + ip
+
+    pol = ~eq
+    tp = tt[pol] - np.floor(tt[pol])
+    tmp = nside*np.sqrt(3*(1 - za[pol]))
+    jp = (tp*tmp).astype('i8')
+    jm = ((1 - tp)*tmp).astype('i8')
+    ir = jp + jm + 1  # ring number counted from the closest pole
+    ip = np.mod((tt[pol]*ir).astype('i8'), 4*ir)
+    pix[pol] = np.where(z[pol] > 0, 2*ir*(ir - 1) + ip, npix - 2*ir*(ir + 1) + ip)
+    return pix
+
+
+def _zphi2pix_scalar(nside, z, phi):
+    """ Pure Python version of _zphi2pix for one position (avoids NumPy call overhead in the real-time path).
+    """
+
+    za = abs(z)
+    tt = (phi % (2*math.pi))/(math.pi/2)
+    tt = 0. if tt >= 4 else tt
+    if za <= 2/3:
+        temp1 = nside*(0.5 + tt)
+        temp2 = nside*z*0.75
+        jp, jm = int(temp1 - temp2), int(temp1 + temp2)
+        ir = nside + 1 + jp - jm
+        ip = ((jp + jm - nside + 1 - (ir & 1) + 1)//2) % (4*nside)
+        return 2*nside*(nside - 1) + (ir - 1)*4*nside + ip
+
+    tp = tt - math.floor(tt)
+    tmp = nside*math.sqrt(3*(1 - za))
+    ir = int(tp*tmp) + int((1 - tp)*tmp) + 1
+    ip = int(tt*ir) % (4*ir)
+    return 2*ir*(ir - 1) + ip if z > 0 else 12*nside*nside - 2*ir*(ir + 1) + ip
+
+
+def ang2pix(nside, ra, dec):
+    """ HEALPix RING pixel index of arrays of ra, dec in degrees.
+    """
+
+    ra = np.atleast_1d(np.asarray(ra, dtype=float))
+    dec = np.atleast_1d(np.asarray(dec, dtype=float))
+    return _zphi2pix(nside, np.sin(np.radians(dec)), np.radians(ra))
+
+
+def vec2pix(nside, xyz):
+    """ HEALPix RING pixel index of (N, 3) array of unit vectors.
+    """
+
+    xyz = np.atleast_2d(xyz)
+    return _zphi2pix(nside, np.clip(xyz[:, 2], -1, 1), np.arctan2(xyz[:, 1], xyz[:, 0]))
+
+
+def pix2ang(nside, pix):
+    """ Return ra, dec in degrees of centers of HEALPix RING pixels.
+    """
+
+    pix = np.atleast_1d(np.asarray(pix, dtype='i8'))
+    ncap = 2*nside*(nside - 1)
+    npix = nside2npix(nside)
+    z, phi = np.zeros(pix.shape), np.zeros(pix.shape)
+
+    north = pix < ncap
+    iring = (1 + np.sqrt(1 + 2*pix[north]).astype('i8')) >> 1
+    iphi = pix[north] + 1 - 2*iring*(iring - 1)
+    z[north] = 1 - iring**2*4/npix
+    phi[north] = (iphi - 0.5)*np.pi/(2*iring)
+
+    eq = (pix >= ncap) & (pix < npix - ncap)
+    ip = pix[eq] - ncap
+    iring = ip//(4*nside) + nside
+    iphi = ip % (4*nside) + 1
+    fodd = np.where((iring + nside) & 1, 1, 0.5)
+    z[eq] = (2*nside - iring)*2/(3*nside)
+    phi[eq] = (iphi - fodd)*np.pi/(2*nside)
+
+    south = pix >= npix - ncap
+    ip = npix - pix[south]
+    iring = (1 + np.sqrt(2*ip - 1).astype('i8')) >> 1
+    iphi = 4*iring + 1 - (ip - 2*iring*(iring - 1))
+    z[south] = -1 + iring**2*4/npix
+    phi[south] = (iphi - 0.5)*np.pi/(2*iring)
+
+    return np.degrees(phi), np.degrees(np.arcsin(z))
+
+
+def _disc_pixels(nside, xyz, radius):
+    """ Pixels that may contain a point within radius (arcsec) of any source in (N, 3) array xyz.
+    Pixels near each source are found by sampling the disc extended by three pixel sizes, then kept if their center
+    is within radius plus 1.5 pixel sizes (above the largest pixel radius) of the source.
+    """
+
+    if not len(xyz):
+        return np.zeros(0, dtype='i8')
+    resol = nside2resol(nside)
+    rad = np.radians(radius/3600)
+    reach = rad + 3*resol
+    step = resol/3
+    grid = np.arange(-reach, reach + step, step)
+    dx, dy = [offsets.ravel() for offsets in np.meshgrid(grid, grid)]
+    keep = dx**2 + dy**2 <= reach**2
+    dx, dy = dx[keep], dy[keep]
+
+    # sample in the tangent plane at each source, a chunk of sources at a time to bound memory
+    pixels = []
+    for start in range(0, len(xyz), max(1, 2000000//len(dx))):
+        chunk = xyz[start:start + max(1, 2000000//len(dx))]
+        dec = np.arcsin(np.clip(chunk[:, 2], -1, 1))
+        ra = np.arctan2(chunk[:, 1], chunk[:, 0])
+        east = np.stack([-np.sin(ra), np.cos(ra), np.zeros(len(ra))], axis=-1)
+        north = np.stack([-np.sin(dec)*np.cos(ra), -np.sin(dec)*np.sin(ra), np.cos(dec)], axis=-1)
+        points = chunk[:, None] + dx[None, :, None]*east[:, None] + dy[None, :, None]*north[:, None]
+        points /= np.linalg.norm(points, axis=-1, keepdims=True)
+
+        pairs = np.unique(np.stack([np.repeat(np.arange(len(chunk)), len(dx)),
+                                    vec2pix(nside, points.reshape(-1, 3))], axis=-1), axis=0)
+        centers = lookup.unitvectors(*pix2ang(nside, pairs[:, 1]))
+        chord = np.linalg.norm(centers - chunk[pairs[:, 0]], axis=1)
+        pixels.append(pairs[chord <= 2*np.sin(min(rad + 1.5*resol, np.pi)/2), 1])
+    return np.unique(np.concatenate(pixels))
+
+
+def build_skymask(outpath=None, nside=1024, nvss_radius=60, nvss_flux=400, atnf_radius=60,
+                  nvsscat='nvss_astropy.pkl', atnfcat='atnfcat_v1.56.txt', workdir=lookup._install_dir):
+    """ Build HEALPix (RING) bitmap of pixels near NVSS sources brighter than nvss_flux or ATNF pulsars.
+    Catalogs that are not available are skipped. Bitmap and header (nside, radii, flux cut, catalogs) are
+    written to a new directory that then replaces outpath (default skymask_n<nside>.mask in workdir),
+    like lookup.build_catalog, so processes that have the old mask memory-mapped keep reading it.
+    Returns outpath.
+    """
+
+    outpath = outpath if outpath is not None else os.path.join(workdir, f'skymask_n{nside}.mask')
+    flagged, catalogs = [], []
+    if lookup._available(nvsscat, workdir):
+        index = lookup.nvss_index(nvsscat, workdir=workdir)
+        bright = np.flatnonzero(index.column('flux', index.orig_index) > nvss_flux)  # in order of index.xyz
+        flagged.append(_disc_pixels(nside, np.asarray(index.xyz)[bright], nvss_radius))
+        catalogs.append('nvss')
+    if lookup._available(atnfcat, workdir):
+        index = lookup.atnf_index(atnfcat, workdir=workdir)
+        flagged.append(_disc_pixels(nside, np.asarray(index.xyz), atnf_radius))
+        catalogs.append('atnf')
+    assert catalogs, f"No catalogs found in {workdir}"
+
+    bits = np.zeros(nside2npix(nside), dtype=bool)
+    bits[np.concatenate(flagged)] = True
+    parent, base = os.path.split(os.path.abspath(outpath))
+    tmppath = tempfile.mkdtemp(prefix=f'.{base}.', dir=parent)
+    np.save(os.path.join(tmppath, 'bits.npy'), np.packbits(bits, bitorder='little'))
+
+    header = {'version': SKYMASK_VERSION, 'nside': nside, 'ordering': 'RING', 'catalogs': catalogs,
+              'nvss_radius': nvss_radius, 'nvss_flux': nvss_flux, 'atnf_radius': atnf_radius,
+              'nvsscat': nvsscat, 'atnfcat': atnfcat, 'workdir': os.path.abspath(workdir),
+              'nflagged': int(bits.sum())}
+    with open(os.path.join(tmppath, 'header.json'), 'w') as fp:
+        json.dump(header, fp)
+    lookup._replace_dir(tmppath, outpath)
+    return outpath
+
+
+class SkyMask:
+    """ Memory-mapped HEALPix veto bitmap written by build_skymask.
+    flagged() is a pixel computation and one array read per position. check() runs the exact
+    find_associations only for positions in flagged pixels.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'header.json'), 'r') as fp:
+            self.header = json.load(fp)
+        assert self.header['version'] <= SKYMASK_VERSION, f"Sky mask version {self.header['version']} not supported"
+        self.nside = self.header['nside']
+        self.bits = np.load(os.path.join(path, 'bits.npy'), mmap_mode='r')
+
+    @property
+    def mode(self):
+        return 'both' if len(self.header['catalogs']) == 2 else {'nvss': 'nvss', 'atnf': 'pulsar'}[self.header['catalogs'][0]]
+
+    def _kwargs(self):
+        return {key: self.header[key] for key in ['nvss_radius', 'nvss_flux', 'atnf_radius', 'nvsscat', 'atnfcat', 'workdir']}
+
+    def flagged(self, ra, dec):
+        """ Boolean array that is True for positions (deg) in flagged pixels.
+        """
+
+        pix = ang2pix(self.nside, ra, dec)
+        return (self.bits[pix >> 3] >> (pix & 7)) & 1 == 1
+
+    def check(self, ra, dec, dm=None):
+        """ Return associations of one candidate as find_associations does, or [] if its pixel is not flagged.
+        """
+
+        pix = _zphi2pix_scalar(self.nside, math.sin(math.radians(dec)), math.radians(ra))
+        if not (self.bits[pix >> 3] >> (pix & 7)) & 1:
+            return []
+        return lookup.find_associations(ra, dec, mode=self.mode, dm=dm, **self._kwargs())
+
+    def check_batch(self, ra, dec, workers=1):
+        """ Return associations for arrays of positions as find_associations_batch does.
+        Only positions in flagged pixels are cross-matched.
+        """
+
+        ra = np.atleast_1d(np.asarray(ra, dtype=float))
+        dec = np.atleast_1d(np.asarray(dec, dtype=float))
+        flagged = np.flatnonzero(self.flagged(ra, dec))
+        associations = lookup.find_associations_batch(ra[flagged], dec[flagged], mode=self.mode, workers=workers,
+                                                      **self._kwargs())
+        if associations is not None:
+            associations['cand'] = flagged[associations['cand']]
+        return associations
+
+
+def _open(fn):
+    return SkyMask(os.path.dirname(fn))
+
+
+def load_skymask(path):
+    """ Return SkyMask at path, cached per process like the lookup catalogs.
+    """
+
+    return lookup._cached(os.path.join(path, 'header.json'), _open)
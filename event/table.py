@@ -0,0 +1,159 @@
+import json
+from pathlib import Path
+import numpy as np
+from event import event
+
+_kinds = {float: 'f8', int: 'i8', bool: '?', str: 'U'}
+_fills = {'f': np.nan, 'i': 0, 'b': False, 'U': ''}
+
+# str fields can hold other json values in real files (labels.check_voltages sets corrNN_data to True).
+# Such columns have dtype object in an EventTable. Catalog and index store the value as json after _JSON_MARK.
+_JSON_MARK = '\x1e'
+
+
+def _encode_str(value):
+    """ Text stored for value of a str field.
+    """
+
+    return value if isinstance(value, str) else _JSON_MARK + json.dumps(value)
+
+
+def _decode_str(text):
+    return json.loads(text[len(_JSON_MARK):]) if text.startswith(_JSON_MARK) else text
+
+
+def _str_array(values):
+    """ Array for values of a str field. dtype is str, or object if any value is not a str.
+    """
+
+    if isinstance(values, np.ndarray) and values.dtype.kind == 'U':
+        array = values
+    elif all(isinstance(vv, str) for vv in values):
+        array = np.asarray(values, dtype=str)
+    else:
+        array = np.empty(len(values), dtype=object)
+        for ii, vv in enumerate(values):
+            array[ii] = vv
+    return array.astype('U1') if array.dtype.itemsize == 0 else array
+
+
+class EventTable:
+    """ Columnar set of DSAEvents in a NumPy structured array.
+    One column per DSAEvent field. Optional fields also have a column in the mask array that is True where the value is None.
+    Columns of optional fields are returned as masked arrays, so selections can be vectorized:
+    tab[(tab['snr'] > 10) & (tab['dm'] > 100) & (tab['dm'] < 200) & tab.isnull('label')]
+    """
+
+    def __init__(self, data, mask):
+        assert data.shape == mask.shape, "data and mask must have same shape"
+        self.data = data
+        self.mask = mask
+
+    @classmethod
+    def from_events(cls, events):
+        """ Build table from an iterable of DSAEvents.
+        """
+
+        events = list(events)
+        columns, masks = {}, {}
+        for name, base, optional in event.field_types():
+            values = [getattr(ev, name) for ev in events]
+            isnull = [vv is None for vv in values]
+            fill = _fills[np.dtype(_kinds[base]).kind]
+            columns[name] = [fill if vv is None else vv for vv in values]
+            if optional:
+                masks[name] = isnull
+            else:
+                assert not any(isnull), f"Required field {name} is None"
+
+        return cls.from_columns(columns, masks)
+
+    @classmethod
+    def from_columns(cls, columns, masks=None):
+        """ Build table from dict of column values for every DSAEvent field.
+        masks is dict of boolean arrays (True for None) for optional fields. Missing masks are all False.
+        """
+
+        masks = masks if masks is not None else {}
+        nrows = len(columns['trigname'])
+        dtype, mdtype, arrays = [], [], {}
+        for name, base, optional in event.field_types():
+            if base is str:
+                arrays[name] = _str_array(columns[name]).reshape(nrows)
+            else:
+                arrays[name] = np.asarray(columns[name], dtype=_kinds[base]).reshape(nrows)
+            dtype.append((name, arrays[name].dtype))
+            if optional:
+                mdtype.append((name, '?'))
+
+        data = np.empty(nrows, dtype=dtype)
+        for name, values in arrays.items():
+            data[name] = values
+        mask = np.zeros(nrows, dtype=mdtype)
+        for name, values in masks.items():
+            mask[name] = values
+
+        return cls(data, mask)
+
+    @classmethod
+    def from_dir(cls, path, pattern='*.json', workers=1):
+        """ Build table from all T2/T3 json files in a directory.
+        Files that cannot be read as a DSAEvent are skipped.
+        workers > 1 parses files in parallel (see event.create_events).
+        """
+
+        events = []
+        for ev in event.create_events(sorted(Path(path).glob(pattern)), workers=workers):
+            if isinstance(ev, event.EventError):
+                print(f'Skipping {ev.path} ({ev.error})')
+            else:
+                events.append(ev)
+        return cls.from_events(events)
+
+    @property
+    def names(self):
+        return self.data.dtype.names
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, key):
+        """ String key returns a column (masked array for optional fields).
+        Anything else (boolean mask, slice, index array) selects rows and returns a new EventTable.
+        """
+
+        if isinstance(key, str):
+            if key in self.mask.dtype.names:
+                return np.ma.MaskedArray(self.data[key], mask=self.mask[key])
+            return self.data[key]
+
+        if isinstance(key, (int, np.integer)):
+            key = [key]
+        if isinstance(key, np.ma.MaskedArray):
+            key = key.filled(False)
+        return EventTable(self.data[key], self.mask[key])
+
+    def isnull(self, name):
+        """ Boolean array that is True where field is None.
+        """
+
+        if name in self.mask.dtype.names:
+            return self.mask[name].copy()
+        return np.zeros(len(self), dtype=bool)
+
+    def to_events(self):
+        """ Convert rows back to list of DSAEvents.
+        """
+
+        optional = set(self.mask.dtype.names)
+        columns = []
+        for name in self.names:
+            values = self.data[name].tolist()
+            if name in optional:
+                values = [None if isnull else vv for vv, isnull in zip(values, self.mask[name].tolist())]
+            columns.append(values)
+
+        return [event.DSAEvent(**dict(zip(self.names, row))) for row in zip(*columns)]
+
+    def __iter__(self):
+        return iter(self.to_events())
@@ -0,0 +1,63 @@
+import argparse
+import json
+import tempfile
+import time
+from dataclasses import asdict, replace
+from os import path
+from event import event
+
+_install_dir = path.abspath(path.dirname(event.__file__))
+
+
+def rate(func, events):
+    """ Return events per second for calling func on each event.
+    """
+
+    t0 = time.perf_counter()
+    for ev in events:
+        func(ev)
+    return len(events)/(time.perf_counter() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure DSAEvent tojson/writejson throughput')
+    parser.add_argument('--n', type=int, default=20000, help='number of events to serialize')
+    parser.add_argument('--triggerfile', type=str, default=f'{_install_dir}/data/t2trigger.json')
+    args = parser.parse_args()
+
+    dd = event.create_event(args.triggerfile)
+    for corr in event.CORR_NODES:
+        setattr(dd, f'{corr}_data', f'{dd.trigname}_data.out')
+    events = [replace(dd, trigname=f'{dd.trigname}{ii}') for ii in range(args.n)]
+
+    print(f'orjson backend: {event.orjson is not None}')
+    print(f'{"tojson (asdict + json.dumps)":>36}: {rate(lambda ev: json.dumps(asdict(ev)), events):10.0f} events/s')
+    print(f'{"tojson()":>36}: {rate(lambda ev: ev.tojson(), events):10.0f} events/s')
+    print(f'{"tojson(compact=True)":>36}: {rate(lambda ev: ev.tojson(compact=True), events):10.0f} events/s')
+
+    with tempfile.TemporaryDirectory() as outpath:
+        def writejson_old(ev):
+            with open(path.join(outpath, f'{ev.trigname}.json'), 'w') as fp:
+                json.dump(asdict(ev), fp, ensure_ascii=False, indent=4)
+
+        def update_old(ev):
+            fn = path.join(outpath, f'{ev.trigname}.json')
+            dsaevent0 = event.create_event(fn)
+            dsaevent0.update(ev)
+            with open(fn, 'w') as fp:
+                json.dump(asdict(ev), fp, ensure_ascii=False, indent=4)
+
+        print(f'{"writejson (asdict + json.dump)":>36}: {rate(writejson_old, events):10.0f} events/s')
+        print(f'{"update (create_event + json.dump)":>36}: {rate(update_old, events):10.0f} events/s')
+    with tempfile.TemporaryDirectory() as outpath:
+        print(f'{"writejson()":>36}: {rate(lambda ev: ev.writejson(outpath), events):10.0f} events/s')
+        print(f'{"writejson() existing file":>36}: {rate(lambda ev: ev.writejson(outpath), events):10.0f} events/s')
+    with tempfile.TemporaryDirectory() as outpath:
+        print(f'{"writejson(compact=True)":>36}: '
+              f'{rate(lambda ev: ev.writejson(outpath, compact=True), events):10.0f} events/s')
+        print(f'{"writejson(compact=True) existing file":>36}: '
+              f'{rate(lambda ev: ev.writejson(outpath, compact=True), events):10.0f} events/s')
+
+
+if __name__ == '__main__':
+    main()
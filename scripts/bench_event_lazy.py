@@ -0,0 +1,55 @@
+import argparse
+import tempfile
+import time
+import tracemalloc
+from dataclasses import replace
+from os import path
+from event import event
+
+_install_dir = path.abspath(path.dirname(event.__file__))
+
+
+def scan(fns, lazy):
+    """ Read all files and touch the core fields, as done by caltechdata/gcn.
+    Returns events, seconds and bytes held per event.
+    """
+
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    events = [event.create_event(fn, lazy=lazy) for fn in fns]
+    snrs = [(ev.mjds, ev.snr, ev.dm, ev.ra, ev.dec, ev.trigname) for ev in events]
+    dt = time.perf_counter() - t0
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(snrs) == len(fns)
+    return events, dt, held/len(fns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare create_event with create_event(lazy=True) on T3 json files')
+    parser.add_argument('--n', type=int, default=5000, help='number of json files to scan')
+    parser.add_argument('--triggerfile', type=str, default=f'{_install_dir}/data/t2trigger.json')
+    args = parser.parse_args()
+
+    # T3-like event with all per-node fields filled in
+    dd = event.create_event(args.triggerfile)
+    for name, base, optional in event.field_types():
+        if optional and getattr(dd, name) is None:
+            setattr(dd, name, {str: f'/dataz/dsa110/T3/{dd.trigname}/{name}.out', float: 1.5, int: 2, bool: True}[base])
+
+    with tempfile.TemporaryDirectory() as outpath:
+        fns = []
+        for ii in range(args.n):
+            ev = replace(dd, trigname=f'{dd.trigname}{ii}')
+            ev.writejson(outpath)
+            fns.append(path.join(outpath, f'{ev.trigname}.json'))
+
+        print(f'orjson backend: {event.orjson is not None}')
+        print(f'{"mode":>8} {"events/s":>10} {"bytes/event":>12}  (n={args.n})')
+        for lazy in [False, True]:
+            events, dt, held = scan(fns, lazy)
+            print(f'{"lazy" if lazy else "full":>8} {args.n/dt:10.0f} {held:12.0f}')
+
+
+if __name__ == '__main__':
+    main()
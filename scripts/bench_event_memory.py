@@ -0,0 +1,51 @@
+import argparse
+import tracemalloc
+from dataclasses import make_dataclass, fields, field, asdict, MISSING
+from os import path
+from event import event
+
+_install_dir = path.abspath(path.dirname(event.__file__))
+
+
+def measure(cls, kwargs, n):
+    """ Return bytes allocated per instance for n instances of cls.
+    """
+
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    events = [cls(**kwargs) for _ in range(n)]
+    end, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(events) == n
+    return (end - start)/n
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare memory use of DSAEvent with a plain dataclass')
+    parser.add_argument('--n', type=int, default=100000, help='number of events to hold in memory')
+    parser.add_argument('--triggerfile', type=str, default=f'{_install_dir}/data/t2trigger.json')
+    args = parser.parse_args()
+
+    # same fields, but with one instance attribute per field
+    PlainDSAEvent = make_dataclass('PlainDSAEvent', [(ff.name, ff.type) if ff.default is MISSING
+                                                     else (ff.name, ff.type, field(default=ff.default))
+                                                     for ff in fields(event.DSAEvent)])
+
+    t2 = asdict(event.create_event(args.triggerfile))
+    t3 = dict(t2)  # T3 candidate with voltages and snrs filled in
+    for ii in range(10):
+        t3[f'snrs{ii}'] = 10.
+        t3[f'beams{ii}'] = ii
+    for corr in event.CORR_NODES:
+        t3[f'{corr}_data'] = f'{t3["trigname"]}_data.out'
+        t3[f'{corr}_header'] = f'{t3["trigname"]}_header.json'
+
+    print(f'{"case":>8} {"plain":>10} {"compact":>10} {"ratio":>6}  (bytes per event, n={args.n})')
+    for case, kwargs in [('T2', t2), ('T3', t3)]:
+        plain = measure(PlainDSAEvent, kwargs, args.n)
+        compact = measure(event.DSAEvent, kwargs, args.n)
+        print(f'{case:>8} {plain:10.0f} {compact:10.0f} {plain/compact:6.2f}')
+
+
+if __name__ == '__main__':
+    main()
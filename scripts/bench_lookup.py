@@ -0,0 +1,152 @@
+import argparse
+import os
+import pickle
+import shutil
+import tempfile
+import time
+import tracemalloc
+from os import path
+import numpy as np
+from astropy import coordinates, table, units
+from event import lookup, skymask
+
+
+def seconds(func):
+    t0 = time.perf_counter()
+    func()
+    return time.perf_counter() - t0
+
+
+def peak(func):
+    """ Return seconds and peak traced memory (MB) of calling func.
+    """
+
+    tracemalloc.start()
+    dt = seconds(func)
+    size = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return dt, size/1e6
+
+
+def find_associations_baseline(ra, dec, nvss_radius=60, nvss_flux=400, atnf_radius=60,
+                               nvsscat='nvss_astropy.pkl', atnfcat='atnfcat_v1.56.txt', workdir=lookup._install_dir):
+    """ find_associations(mode='both') as it was before the catalog cache and radius queries:
+    both catalogs are read and matched with SkyCoord.match_to_catalog_sky on every call.
+    """
+
+    with open(os.path.join(workdir, nvsscat), 'rb') as pkl:
+        catalogn = pickle.load(pkl)
+        fluxesn = pickle.load(pkl)
+    tab = table.Table.read(os.path.join(workdir, atnfcat), format='ascii')
+    cataloga = coordinates.SkyCoord(ra=tab['RAJ'], dec=tab['DECJ'], unit=(units.hourangle, units.deg))
+
+    coord = coordinates.SkyCoord(ra, dec, unit='deg')
+    associations = []
+    ind, sep2, sep3 = coord.match_to_catalog_sky(catalogn)
+    if sep2 < nvss_radius*units.arcsec and fluxesn[ind] > nvss_flux:
+        associations.append(['nvss', catalogn[ind], sep2.value, fluxesn[ind]])
+    ind, sep2, sep3 = coord.match_to_catalog_sky(cataloga)
+    if sep2 < atnf_radius*units.arcsec:
+        name, dm = tab[ind][['PSRJ', 'DM']]
+        associations.append(['atnf', cataloga[ind], sep2.value, name, dm])
+    return associations
+
+
+def write_nvss(workdir, size, rng):
+    """ Write synthetic NVSS pickle with size sources and a copy of the ATNF catalog to workdir.
+    """
+
+    nra = rng.uniform(0, 360, size)
+    ndec = np.degrees(np.arcsin(rng.uniform(-0.5, 1, size)))
+    with open(path.join(workdir, 'nvss_astropy.pkl'), 'wb') as pkl:
+        pickle.dump(coordinates.SkyCoord(nra, ndec, unit='deg'), pkl)
+        pickle.dump(rng.lognormal(3, 2, size), pkl)
+    shutil.copy(path.join(lookup._install_dir, 'atnfcat_v1.56.txt'), workdir)
+
+
+def positions(rng, n):
+    return rng.uniform(0, 360, n), np.degrees(np.arcsin(rng.uniform(-0.5, 1, n)))
+
+
+def catalog_scale(rng, size, n):
+    """ Array queries of n positions against a catalog of size sources, with SkyIndex and compiled catalog.
+    """
+
+    ra, dec = positions(rng, n)
+    with tempfile.TemporaryDirectory() as workdir:
+        write_nvss(workdir, size, rng)
+        lookup.clear_cache()
+        lookup.nvss_index(workdir=workdir)
+        dt, mb = peak(lambda: lookup.query_nvss(ra, dec, workdir=workdir))
+        print(f'{f"query_nvss {size} sources (SkyIndex)":>36}: {dt:10.2f} s {mb:8.0f} MB')
+
+        lookup.build_catalog('nvss_astropy.pkl', workdir=workdir)
+        lookup.clear_cache()
+        lookup.nvss_index(workdir=workdir)
+        dt, mb = peak(lambda: lookup.query_nvss(ra, dec, workdir=workdir))
+        print(f'{f"query_nvss {size} sources (compiled)":>36}: {dt:10.2f} s {mb:8.0f} MB (builds tree)')
+        dt, mb = peak(lambda: lookup.query_nvss(ra, dec, workdir=workdir))
+        print(f'{f"query_nvss {size} sources (compiled)":>36}: {dt:10.2f} s {mb:8.0f} MB')
+        dt = seconds(lambda: [lookup.query_nvss(r, d, workdir=workdir) for r, d in zip(ra[:1000], dec[:1000])])
+        print(f'{f"query_nvss {size} sources (compiled)":>36}: {1e6*dt/1000:10.1f} us/candidate (per call)')
+    lookup.clear_cache()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare per-call find_associations with array radius queries')
+    parser.add_argument('--n', type=int, default=1000, help='number of candidate positions')
+    parser.add_argument('--baseline-n', type=int, default=20, help='number of positions for the original path')
+    parser.add_argument('--nvss-size', type=int, default=200000, help='number of sources in synthetic NVSS catalog')
+    parser.add_argument('--catalog-size', type=int, default=1800000,
+                        help='number of sources in catalog-scale case (0 to skip)')
+    parser.add_argument('--catalog-n', type=int, default=100000, help='number of positions in catalog-scale case')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    ra, dec = positions(rng, args.n)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        write_nvss(workdir, args.nvss_size, rng)
+        nb = min(args.baseline_n, args.n)
+        dt = seconds(lambda: [find_associations_baseline(r, d, workdir=workdir) for r, d in zip(ra[:nb], dec[:nb])])
+        print(f'{"find_associations both (original)":>36}: {1e6*dt/nb:10.1f} us/candidate')
+
+        lookup.clear_cache()
+        dt = seconds(lambda: lookup.query_nvss(ra[:1], dec[:1], workdir=workdir))
+        print(f'{"cold start nvss (pickle)":>36}: {1e3*dt:10.1f} ms')
+        lookup.build_catalog('nvss_astropy.pkl', workdir=workdir)
+        lookup.clear_cache()
+        dt = seconds(lambda: lookup.query_nvss(ra[:1], dec[:1], workdir=workdir))
+        print(f'{"cold start nvss (compiled)":>36}: {1e3*dt:10.1f} ms')
+        dt = seconds(lambda: lookup.query_nvss(ra, dec, workdir=workdir))
+        print(f'{"query_nvss (array, compiled)":>36}: {1e6*dt/args.n:10.1f} us/candidate')
+        shutil.rmtree(lookup.compiled_path('nvss_astropy.pkl', workdir))
+        lookup.clear_cache()
+        lookup.warm_cache(workdir=workdir)
+
+        dt = seconds(lambda: [lookup.find_associations(r, d, workdir=workdir) for r, d in zip(ra, dec)])
+        print(f'{"find_associations both (per call)":>36}: {1e6*dt/args.n:10.1f} us/candidate')
+        dt = seconds(lambda: [lookup.find_associations(r, d, mode='nvss', workdir=workdir) for r, d in zip(ra, dec)])
+        print(f'{"find_associations nvss (per call)":>36}: {1e6*dt/args.n:10.1f} us/candidate')
+        dt = seconds(lambda: lookup.query_nvss(ra, dec, workdir=workdir))
+        print(f'{"query_nvss (array)":>36}: {1e6*dt/args.n:10.1f} us/candidate')
+
+    lookup.warm_cache()
+    dt = seconds(lambda: [lookup.find_associations(r, d, mode='pulsar') for r, d in zip(ra, dec)])
+    print(f'{"find_associations pulsar (per call)":>36}: {1e6*dt/args.n:10.1f} us/candidate')
+    dt = seconds(lambda: lookup.query_atnf(ra, dec))
+    print(f'{"query_atnf (array)":>36}: {1e6*dt/args.n:10.1f} us/candidate')
+    dt = seconds(lambda: lookup.find_associations_batch(ra, dec, mode='pulsar', workers=4, chunksize=max(args.n//4, 1)))
+    print(f'{"find_associations_batch pulsar":>36}: {1e6*dt/args.n:10.1f} us/candidate')
+
+    with tempfile.TemporaryDirectory() as maskdir:
+        mask = skymask.SkyMask(skymask.build_skymask(path.join(maskdir, 'mask'), nside=1024))
+        dt = seconds(lambda: [mask.check(r, d) for r, d in zip(ra, dec)])
+        print(f'{"SkyMask.check pulsar (per call)":>36}: {1e6*dt/args.n:10.1f} us/candidate')
+
+    if args.catalog_size:
+        catalog_scale(rng, args.catalog_size, args.catalog_n)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+import argparse
+import tempfile
+import time
+from os import path
+from event import names
+
+
+def rate(func, n):
+    """ Return calls per second of func.
+    """
+
+    t0 = time.perf_counter()
+    for _ in range(n):
+        func()
+    return n/(time.perf_counter() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure naming path without etcd')
+    parser.add_argument('--n', type=int, default=10000, help='number of calls per case')
+    args = parser.parse_args()
+
+    value = {names.TRIGGER_KEY: {'210810aaaa': {'mjds': 59436.5}}}
+    mjd = 59436.5
+    cache = names.LastNameCache(backend=names.MemoryBackend(value))
+    print(f'{"get_lastname (memory, watched)":>36}: {rate(lambda: names.get_lastname(cache=cache), args.n):10.0f} calls/s')
+    with tempfile.TemporaryDirectory() as statedir:
+        backend = names.FileBackend(path.join(statedir, 'etcd.json'))
+        backend.put(names.TRIGGER_KEY, value[names.TRIGGER_KEY])
+        cache = names.LastNameCache(backend=backend)
+        print(f'{"get_lastname (file, polled)":>36}: {rate(lambda: names.get_lastname(cache=cache), args.n):10.0f} calls/s')
+
+        print(f'{"increment_name (random)":>36}: '
+              f'{rate(lambda: names.increment_name(mjd, lastname="210810aaaa"), args.n):10.0f} calls/s')
+        allocator = names.NameAllocator()
+        print(f'{"NameAllocator.allocate (memory)":>36}: {rate(lambda: allocator.allocate(mjd), args.n):10.0f} calls/s')
+        allocator = names.NameAllocator(statedir=statedir)
+        print(f'{"NameAllocator.allocate (statedir)":>36}: {rate(lambda: allocator.allocate(mjd), args.n):10.0f} calls/s')
+
+
+if __name__ == '__main__':
+    main()
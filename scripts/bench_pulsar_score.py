@@ -0,0 +1,48 @@
+import argparse
+import time
+import numpy as np
+from event import lookup
+
+
+def seconds(func):
+    t0 = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Score candidates at every ATNF pulsar and at random positions')
+    parser.add_argument('--offset', type=float, default=30, help='position offset of pulsar candidates (arcsec)')
+    parser.add_argument('--dm-scatter', type=float, default=0.05, help='fractional DM scatter of pulsar candidates')
+    parser.add_argument('--percall', type=int, default=500, help='number of candidates scored one at a time')
+    args = parser.parse_args()
+
+    tab, cataloga = lookup.load_atnf()
+    lookup.warm_cache()
+    rng = np.random.default_rng(0)
+    npsr = len(tab)
+    dm = np.asarray(tab['DM'], dtype=float)
+    ra = cataloga.ra.deg + args.offset/3600/np.maximum(np.cos(cataloga.dec.rad), 1e-3)
+    dec = cataloga.dec.deg
+    dm = dm*(1 + args.dm_scatter*rng.standard_normal(npsr))
+
+    (veto, best), dt = seconds(lambda: lookup.pulsar_veto(ra, dec, dm))
+    print(f'{"pulsar_veto (batch, ATNF)":>32}: {1e6*dt/npsr:8.1f} us/candidate, {veto.mean():.3f} vetoed')
+
+    n = min(args.percall, npsr)
+    _, dt = seconds(lambda: [lookup.pulsar_veto(ra[i], dec[i], dm[i]) for i in range(n)])
+    print(f'{"pulsar_veto (per call)":>32}: {1e6*dt/n:8.1f} us/candidate')
+
+    rra = rng.uniform(0, 360, npsr)
+    rdec = np.degrees(np.arcsin(rng.uniform(-0.5, 1, npsr)))
+    rdm = rng.uniform(50, 2000, npsr)
+    (veto, best), dt = seconds(lambda: lookup.pulsar_veto(rra, rdec, rdm))
+    print(f'{"pulsar_veto (batch, random)":>32}: {1e6*dt/npsr:8.1f} us/candidate, {veto.mean():.3f} vetoed')
+
+    veto_pos = np.zeros(npsr, dtype=bool)
+    veto_pos[np.unique(lookup.query_atnf(rra, rdec)['cand'])] = True
+    print(f'{"position-only match (random)":>32}: {veto_pos.mean():.3f} matched')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+import pytest
+from os import path
+from dataclasses import replace
+from event import event, catalog
+
+_install_dir = path.abspath(path.dirname(event.__file__))
+
+
+def test_append(tmp_path):
+    dd = event.create_event(f"{_install_dir}/data/t2trigger.json")
+    events = [replace(dd, trigname=f'{dd.trigname}{ii}', dm=float(ii)) for ii in range(5)]
+    events[2].corr03_data = 'data.out'
+    events[3].label = 'rfi'
+
+    cat = catalog.EventCatalog(tmp_path / 'catalog')
+    cat.append(events[:3])
+    cat.append(events[3:])
+
+    cat = catalog.EventCatalog(tmp_path / 'catalog', create=False)
+    assert len(cat) == 5
+    assert list(cat.column('dm')) == [0., 1., 2., 3., 4.]
+    assert cat.column('label').mask.tolist() == [True, True, True, False, True]
+    assert cat.event(2) == events[2]
+    assert list(cat) == events
+
+
+def test_voltage_flags(tmp_path):
+    dd = event.create_event(f"{_install_dir}/data/t2trigger.json")
+    events = [replace(dd, trigname=f'{dd.trigname}{ii}') for ii in range(3)]
+    events[0].corr03_data, events[0].corr03_header = True, True  # as written by labels.check_voltages
+    events[1].corr03_data = 'data.out'
+
+    cat = catalog.EventCatalog(tmp_path / 'catalog')
+    cat.append(events)
+    assert cat.column('corr03_data').tolist() == [True, 'data.out', None]
+    assert cat.column('corr03_header', [1, 2]).dtype.kind == 'U'
+    assert list(cat) == events
+    assert cat.event(0).corr03_header is True
+
+
+def test_files(tmp_path):
+    cat = catalog.EventCatalog(tmp_path / 'catalog')
+    errors = cat.append_files([f"{_install_dir}/data/t2trigger.json", f"{_install_dir}/data/example43.json"])
+    assert len(cat) == 1 and len(errors) == 1
+
+
+def test_missing_optional(tmp_path, monkeypatch):
+    dd = event.create_event(f"{_install_dir}/data/t2trigger.json")
+    types = event.field_types()
+    monkeypatch.setattr(event, 'field_types', lambda: [tt for tt in types if tt[0] != 'schema_version'])
+    cat = catalog.EventCatalog(tmp_path / 'catalog')  # as created before schema_version was added
+    cat.append([dd])
+    monkeypatch.undo()
+
+    cat = catalog.EventCatalog(tmp_path / 'catalog', create=False)
+    assert cat.isnull('schema_version').all() and cat.column('schema_version').mask.all()
+    cat.append([replace(dd, trigname='210810aaab')])
+    assert len(cat) == 2 and cat.event(1).trigname == '210810aaab'
+    assert [ev.schema_version for ev in cat] == [None, None]
+    assert replace(cat.event(0), schema_version=dd.schema_version) == dd
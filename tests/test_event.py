@@ -1,7 +1,10 @@
 import pytest
 from os import path
-from event import event
+import shutil
+from event import event, labels
 from astropy import time
+from dataclasses import asdict
+import json
 
 _install_dir = path.abspath(path.dirname(event.__file__))
 
@@ -29,3 +32,66 @@ def test_write():
 #def test_writelock():
 #    dd = event.create_event("data/t2trigger.json")
 #    dd.writejson(outpath="./testout.json", lock=LOCK)
+
+def test_compact():
+    dd = event.create_event(f"{_install_dir}/data/t2trigger.json")
+    assert not hasattr(dd, '__dict__')
+    assert dd.corr03_data is None and dd.snrs9 is None
+
+    dd.corr05_header = 'header.json'
+    dd.snrs9 = 10.
+    dd2 = event.DSAEvent(**asdict(dd))
+    assert dd2 == dd
+    assert dd2.corr05_header == 'header.json' and dd2.corr05_data is None
+    assert asdict(dd2)['snrs9'] == 10.
+
+def test_create_events(tmp_path):
+    (tmp_path / "bad.json").write_text('{"trigname": "bad"')
+    fns = [f"{_install_dir}/data/t2trigger.json", f"{_install_dir}/data/t2trigger0.json",
+           tmp_path / "bad.json", tmp_path / "missing.json"]
+
+    for workers in [1, 2]:
+        events = list(event.create_events(fns, workers=workers, chunksize=1))
+        assert [type(ev) for ev in events] == [event.DSAEvent, event.DSAEvent, event.EventError, event.EventError]
+        assert events[0].trigname == events[1].trigname
+
+    events = list(event.create_events(fns, workers=2, ordered=False))
+    assert len(events) == 4
+
+def test_todict():
+    dd = event.create_event(f"{_install_dir}/data/t2trigger.json")
+    dd.snrs3 = 12.
+    dd.corr21_data = 'data.out'
+    assert list(dd.todict().items()) == list(asdict(dd).items())
+
+    assert json.loads(dd.tojson(compact=True)) == asdict(dd)
+    assert json.loads(dd.tojson()) == asdict(dd)
+
+def test_lazy():
+    dd = event.create_event(f"{_install_dir}/data/t2trigger0.json", lazy=True)
+    assert isinstance(dd, event.LazyDSAEvent)
+    assert dd.dm == 29.0454
+    assert dd._source is not None
+
+    assert dd.gulp == 1
+    assert dd._source is None
+    assert dd == event.create_event(f"{_install_dir}/data/t2trigger0.json")
+
+
+def test_lazy_extra_keys(tmp_path):
+    fn = tmp_path / "210810aaaa.json"
+    shutil.copy(f"{_install_dir}/data/t2trigger.json", fn)
+    labels.set_notes('bright', filename=str(fn))
+    raw = labels.readfile(filename=str(fn))
+    dd = event.create_event(fn, lazy=True)
+    assert (dd.mjds, dd.dm) == (raw['mjds'], raw['dm'])
+    assert dd.gulp == raw.get('gulp') and dd._source is None
+
+def test_dumps_numpy(tmp_path):
+    np = pytest.importorskip('numpy')
+    dd = event.create_event(f"{_install_dir}/data/t2trigger.json")
+    dd.snr = np.float64(12.5)
+    dd.ibeam = np.int64(100)
+    assert json.loads(dd.tojson(compact=True))['snr'] == 12.5
+    dd.writejson(outpath=tmp_path, compact=True)
+    assert event.create_event(tmp_path / f"{dd.trigname}.json").ibeam == 100
@@ -0,0 +1,41 @@
+import pytest
+import shutil
+from os import path
+from event import event, index, labels
+
+_install_dir = path.abspath(path.dirname(event.__file__))
+
+
+def test_refresh(tmp_path):
+    shutil.copy(f"{_install_dir}/data/t2trigger.json", tmp_path / "210810aaaa.json")
+    with index.EventIndex(tmp_path) as idx:
+        assert idx.refresh() == (1, 0)
+        assert idx.refresh() == (0, 0)
+        assert idx.query(dm_range=(20, 30), snr_min=9, save=True, unlabeled=True) == ['210810aaaa']
+        assert idx.query(snr_min=10) == []
+        assert idx.events() == [event.create_event(tmp_path / "210810aaaa.json")]
+
+        (tmp_path / "210810aaaa.json").unlink()
+        assert idx.refresh() == (0, 1)
+
+
+def test_notify(tmp_path):
+    dd = event.create_event(f"{_install_dir}/data/t2trigger.json")
+    with index.EventIndex(tmp_path) as idx:
+        dd.writejson(outpath=tmp_path)
+        assert idx.query() == ['210810aaaa']
+
+        labels.set_label('rfi', filename=str(tmp_path / "210810aaaa.json"))
+        assert idx.query(label='rfi') == ['210810aaaa']
+
+
+def test_voltage_flags(tmp_path):
+    dd = event.create_event(f"{_install_dir}/data/t2trigger.json")
+    dd.corr03_data, dd.corr03_header = True, True  # as written by labels.check_voltages
+    dd.corr04_data = 'data.out'
+    dd.writejson(outpath=tmp_path)
+    with index.EventIndex(tmp_path) as idx:
+        assert idx.refresh() == (1, 0)
+        ev = idx.events()[0]
+        assert (ev.corr03_data, ev.corr03_header, ev.corr04_data) == (True, True, 'data.out')
+        assert ev == event.create_event(tmp_path / "210810aaaa.json")
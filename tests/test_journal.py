@@ -0,0 +1,85 @@
+import pytest
+import json
+import shutil
+import threading
+from os import path
+from event import event, journal, labels
+
+_install_dir = path.abspath(path.dirname(event.__file__))
+
+
+def test_journal(tmp_path):
+    fn = tmp_path / "210810aaaa.json"
+    shutil.copy(f"{_install_dir}/data/t2trigger.json", fn)
+    base = fn.read_text()
+
+    labels.set_label('rfi', filename=str(fn), journal=True)
+    labels.set_probability(0.9, filename=str(fn), journal=True)
+    dd = event.create_event(fn)
+    dd.gulp = 3
+    dd.writejson(outpath=tmp_path, journal=True)
+    assert fn.read_text() == base
+
+    dd = event.create_event(fn)
+    assert (dd.label, dd.probability, dd.gulp) == ('rfi', 0.9, 3)
+    assert labels.readfile(filename=str(fn))['label'] == 'rfi'
+
+    assert journal.compact_dir(tmp_path) == {fn.name: 3}
+    assert not journal.journal_path(fn).exists()
+    assert json.loads(fn.read_text())['probability'] == 0.9
+    assert event.create_event(fn) == dd
+
+
+def test_journal_then_direct(tmp_path):
+    fn = tmp_path / "210810aaaa.json"
+    shutil.copy(f"{_install_dir}/data/t2trigger.json", fn)
+
+    labels.set_label('rfi', filename=str(fn), journal=True)
+    labels.set_probability(0.9, filename=str(fn), journal=True)
+    labels.set_label('astrophysical', filename=str(fn))
+    assert not journal.journal_path(fn).exists()
+    assert labels.readfile(filename=str(fn))['label'] == 'astrophysical'
+    assert event.create_event(fn).label == 'astrophysical'
+    assert event.create_event(fn).probability == 0.9
+
+
+def test_stale_writejson(tmp_path):
+    fn = tmp_path / "210810aaaa.json"
+    shutil.copy(f"{_install_dir}/data/t2trigger.json", fn)
+
+    dd = event.create_event(fn)
+    labels.set_label('rfi', filename=str(fn), journal=True)
+    labels.set_notes('checked', filename=str(fn))
+    dd.gulp = 3
+    dd.writejson(outpath=tmp_path)
+    assert not journal.journal_path(fn).exists()
+    dd = labels.readfile(filename=str(fn))
+    assert (dd['label'], dd['gulp'], dd['notes']) == ('rfi', 3, 'checked')
+
+    del dd['notes']
+    fn.write_text(json.dumps(dict(dd, save=False, gulp=None)))
+    dd = event.create_event(fn)
+    labels.set_label('save', filename=str(fn), journal=True)
+    dd.gulp = 4
+    dd.writejson(outpath=tmp_path, journal=True)
+    assert journal.deltas(fn) == [{'save': True}, {'gulp': 4}]
+    assert event.create_event(fn).save
+
+
+def test_append_during_compact(tmp_path):
+    fn = tmp_path / "210810aaaa.json"
+    shutil.copy(f"{_install_dir}/data/t2trigger.json", fn)
+
+    def appender(tt):
+        for jj in range(25):
+            journal.append(fn, {f'k{tt}_{jj}': jj})
+
+    threads = [threading.Thread(target=appender, args=(tt,)) for tt in range(4)]
+    for thread in threads:
+        thread.start()
+    while any(thread.is_alive() for thread in threads):
+        journal.compact(fn)
+    journal.compact(fn)
+
+    dd = json.loads(fn.read_text())
+    assert all(f'k{tt}_{jj}' in dd for tt in range(4) for jj in range(25))
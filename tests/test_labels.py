@@ -1,6 +1,11 @@
 import pytest
+import json
+import gzip
+import shutil
+import subprocess
+import numpy as np
 from os import path
-from event import labels
+from event import labels, event
 
 _install_dir = path.abspath(path.dirname(labels.__file__))
 
@@ -16,3 +21,83 @@ def test_prob():
 
 def test_label():
     labels.set_label('save', candname=None, filename=f"{_install_dir}/data/t2trigger.json")
+
+
+def _fake_ssh(outputs):
+    """ Return replacement for subprocess.run that answers ssh calls to host with outputs[host].
+    """
+
+    def run(args, **kwargs):
+        host = args[-2]
+        if host not in outputs:
+            return subprocess.CompletedProcess(args, 255, stdout='', stderr='Could not resolve hostname')
+        return subprocess.CompletedProcess(args, 0, stdout=outputs[host], stderr='')
+    return run
+
+
+def test_probe(monkeypatch):
+    monkeypatch.setattr(subprocess, 'run', _fake_ssh({'corr03.sas.pvt': '1\n0\n'}))
+    assert labels.probe_remote('corr03.sas.pvt', ['/tmp/a', '/tmp/b']) == [True, False]
+    assert labels.probe_remote('nohost.invalid', ['/tmp/a', '/tmp/b']) == [None, None]
+
+
+def test_inventory(monkeypatch):
+    monkeypatch.setattr(subprocess, 'run', _fake_ssh({'corr03.sas.pvt': '1628600000\n210810aaaa_data.out\n'
+                                                                        '210810aaaa_header.json\n'}))
+    inventory = labels.VoltageInventory(corrs=['corr03', 'nohost'])
+    assert inventory.check(['210810aaaa']) == {'210810aaaa': {'corr03': (True, True), 'nohost': (None, None)}}
+    assert inventory.complete(['210810aaaa']) == []
+    assert labels.VoltageInventory().corrs == event.CORR_NODES
+
+
+def test_voltages_batch(tmp_path, monkeypatch):
+    monkeypatch.setattr(subprocess, 'run', _fake_ssh({'corr03.sas.pvt': '1628600000\n210810aaaa_data.out\n'
+                                                                        '210810aaab_data.out\n'}))
+    shutil.copy(f"{_install_dir}/data/t2trigger.json", tmp_path / "210810aaab.json")
+    inventory = labels.VoltageInventory(corrs=['corr03'])
+    found = labels.check_voltages_batch(['210810aaaa', '210810aaab'], inventory=inventory, datadir=tmp_path)
+    assert found['210810aaaa'].startswith('error')
+    assert found['210810aaab'] == {'corr03': (True, False)}
+    assert labels.readfile(candname='210810aaab', datadir=tmp_path)['corr03_data'] is True
+
+
+def test_batch(tmp_path):
+    for candname in ['210810aaaa', '210810aaab']:
+        shutil.copy(f"{_install_dir}/data/t2trigger.json", tmp_path / f"{candname}.json")
+    (tmp_path / "batch.csv").write_text("candname,label,probability,notes\n"
+                                        "210810aaaa,rfi,0.1,\n"
+                                        "210810aaab,,0.95,bright\n"
+                                        "210810aaab,astrophysical,,\n"
+                                        "210810aaab,save,,\n"
+                                        "210810aaac,rfi,,\n"
+                                        "210810aaad,rfi,,\n"
+                                        "210810aaaa,bogus,,\n")
+    (tmp_path / "210810aaad.json").write_text("not json")
+
+    results = labels.set_batch(labels.read_batch_csv(tmp_path / "batch.csv"), datadir=tmp_path)
+    assert results['210810aaab'] == 'ok'
+    assert all(results[candname].startswith('error') for candname in ['210810aaaa', '210810aaac', '210810aaad'])
+
+    dd = labels.readfile(candname='210810aaab', datadir=tmp_path)
+    assert (dd['label'], dd['probability'], dd['notes'], dd['save']) == ('astrophysical', 0.95, 'bright', True)
+    assert labels.readfile(candname='210810aaaa', datadir=tmp_path).get('label') != 'rfi'
+
+
+def test_formats(tmp_path):
+    dd = labels.readfile(filename=f"{_install_dir}/data/t2trigger.json")
+    np.save(tmp_path / "cand.npy", np.array(dd))
+    np.save(tmp_path / "snrs.npy", np.arange(10.))
+    with gzip.open(tmp_path / "cand.json.gz", 'wt') as fp:
+        json.dump(dd, fp)
+
+    assert labels.sniff_format(f"{_install_dir}/data/t2trigger.json") == 'json'
+    assert labels.sniff_format(tmp_path / "cand.npy") == 'npy'
+    assert labels.readfile(filename=tmp_path / "cand.npy") == dd
+    assert labels.readfile(filename=tmp_path / "cand.json.gz") == dd
+    assert isinstance(labels.loadfile(tmp_path / "snrs.npy"), np.memmap)
+
+    for name in ["cand", "snrs"]:
+        with gzip.open(tmp_path / f"{name}.npy.gz", 'wb') as fp:
+            fp.write((tmp_path / f"{name}.npy").read_bytes())
+    assert labels.readfile(filename=tmp_path / "cand.npy.gz") == dd
+    assert labels.loadfile(tmp_path / "snrs.npy.gz").tolist() == list(range(10))
@@ -0,0 +1,26 @@
+import pytest
+import shutil
+from os import path
+from event import labels, labelstore
+
+_install_dir = path.abspath(path.dirname(labels.__file__))
+
+
+def test_store(tmp_path):
+    for candname in ['210810aaaa', '210810aaab', '210811aaaa']:
+        shutil.copy(f"{_install_dir}/data/t2trigger.json", tmp_path / f"{candname}.json")
+
+    with labelstore.LabelStore(tmp_path) as store:
+        assert store.reconcile() == (3, 0)
+        assert store.reconcile() == (0, 0)
+        assert store.query(unlabeled=True, date_from='210811') == ['210811aaaa']
+
+        labels.set_label('rfi', candname='210810aaaa', datadir=tmp_path)
+        labels.set_probability(0.99, candname='210810aaab', datadir=tmp_path, journal=True)
+        assert store.query(label='rfi') == ['210810aaaa']
+        assert store.query(prob_min=0.5, date_to='210810') == ['210810aaab']
+
+        (tmp_path / "210811aaaa.json").unlink()
+        store.set('210810aaaa', {'label': 'astrophysical'})
+        assert store.reconcile() == (1, 1)
+        assert store.get('210810aaaa')['label'] == 'rfi'
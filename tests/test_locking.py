@@ -0,0 +1,40 @@
+import pytest
+import json
+from concurrent.futures import ThreadPoolExecutor
+from event import locking
+
+
+def test_timeout(tmp_path):
+    with locking.lock('210810aaaa', tmp_path):
+        with pytest.raises(TimeoutError):
+            locking.lock('210810aaaa', tmp_path, timeout=0.05).acquire()
+        with locking.lock('210810aaab', tmp_path, timeout=0.05):
+            pass
+
+    assert locking.lock_path('210810aaaa', tmp_path, nshards=16).name.startswith('shard')
+
+
+def test_concurrent(tmp_path):
+    fn = tmp_path / '210810aaaa.json'
+    locking.atomic_write(fn, json.dumps({'count': 0}))
+
+    def increment(ii):
+        with locking.lock('210810aaaa', tmp_path):
+            dd = json.loads(fn.read_text())
+            dd['count'] += 1
+            locking.atomic_write(fn, json.dumps(dd))
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(increment, range(200)))
+    assert json.loads(fn.read_text())['count'] == 200
+    assert [pp.name for pp in tmp_path.iterdir() if pp.suffix == '.tmp'] == []
+
+
+def test_atomic_write_mode(tmp_path):
+    fn = tmp_path / '210810aaaa.json'
+    locking.atomic_write(fn, '{}')
+    assert fn.stat().st_mode & 0o777 == 0o666 & ~locking._UMASK
+
+    fn.chmod(0o640)
+    locking.atomic_write(fn, '{"count": 1}')
+    assert fn.stat().st_mode & 0o777 == 0o640
@@ -0,0 +1,125 @@
+import shutil
+from os import path
+import numpy as np
+from event import lookup
+
+_install_dir = path.abspath(path.dirname(lookup.__file__))
+
+
+def test_pulsar_without_nvss():
+    tab, cataloga = lookup.load_atnf()
+    ra, dec = cataloga[0].ra.deg, cataloga[0].dec.deg
+    associations = lookup.find_associations(ra, dec, mode='pulsar')
+    assert len(associations) == 1 and associations[0][3] == tab['PSRJ'][0]
+    assert lookup.find_associations(ra, dec, mode='both') is None  # no NVSS catalog in repo
+
+
+def test_cache():
+    lookup.clear_cache()
+    catalog = lookup.load_atnf()
+    assert lookup.load_atnf() is catalog
+    assert lookup.warm_cache() == [path.join(_install_dir, 'data', 'atnfcat_v1.56.txt')]
+    lookup.clear_cache()
+    assert lookup.load_atnf() is not catalog
+
+
+def test_query_atnf():
+    tab, cataloga = lookup.load_atnf()
+    ra, dec = cataloga.ra.deg[:100], cataloga.dec.deg[:100]
+    matches = lookup.query_atnf(ra, dec + 10/3600, atnf_radius=60)
+    assert set(matches['cand']) == set(range(100))
+    first = matches[matches['cand'] == 0][0]
+    assert first['index'] == 0 and first['name'] == tab['PSRJ'][0] and abs(first['sep'] - 10) < 1e-3
+    assert first['dm'] == tab['DM'][0]
+    assert len(lookup.query_atnf(ra, dec, atnf_radius=1e-3)) >= 100
+
+
+def test_compiled(tmp_path, monkeypatch):
+    shutil.copy(path.join(_install_dir, 'data', 'atnfcat_v1.56.txt'), tmp_path)
+    outpath = lookup.build_catalog('atnfcat_v1.56.txt', workdir=tmp_path)
+    compiled = lookup.atnf_index(workdir=tmp_path)
+    assert isinstance(compiled, lookup.CompiledCatalog) and compiled.path == outpath
+
+    tab, cataloga = lookup.load_atnf()
+    ra, dec = cataloga.ra.deg[:100] + 0.005, cataloga.dec.deg[:100]
+    matches = lookup.query_atnf(ra, dec, atnf_radius=600, workdir=tmp_path)
+    expected = lookup.query_atnf(ra, dec, atnf_radius=600)
+    assert list(matches['name']) == list(expected['name'])
+    assert list(matches['dm']) == list(expected['dm'])
+    assert list(matches['index']) == list(expected['index'])
+    assert all(abs(matches['sep'] - expected['sep']) < 1e-6)
+    assert list(tab['PSRJ'][matches['index']]) == list(matches['name'])
+
+    pairs = compiled.query_radius(ra, dec, 600)
+    monkeypatch.setattr(lookup, 'BAND_PAIRS', 50)
+    assert compiled.tree is None
+    for values, values2 in zip(pairs, compiled.query_radius(ra, dec, 600)):
+        assert np.allclose(values, values2)
+    assert compiled.tree is not None
+    monkeypatch.setattr(lookup, 'cKDTree', None)  # scan bands a few positions at a time
+    for values, values2 in zip(pairs, compiled.query_radius(ra, dec, 600)):
+        assert np.allclose(values, values2)
+    monkeypatch.undo()
+
+    heap = compiled.heap
+    assert lookup.build_catalog('atnfcat_v1.56.txt', workdir=tmp_path) == outpath
+    assert bytes(heap[:10]) == bytes(compiled.heap[:10])  # old memmap still readable after rebuild
+    lookup.clear_cache()
+    assert list(lookup.query_atnf(ra, dec, atnf_radius=600, workdir=tmp_path)['index']) == list(expected['index'])
+
+    associations = lookup.find_associations(ra[0], dec[0], mode='pulsar', workdir=tmp_path)
+    assert associations[0][3] == tab['PSRJ'][0]
+
+
+def test_find_associations_batch():
+    tab, cataloga = lookup.load_atnf()
+    ra, dec = cataloga.ra.deg[:50], cataloga.dec.deg[:50] + 5/3600
+    associations = lookup.find_associations_batch(ra, dec, mode='pulsar')
+    assert set(associations['cand']) == set(range(50)) and all(associations['catalog'] == 'atnf')
+    nearest = associations[np.unique(associations['cand'], return_index=True)[1]]
+    for ii in [0, 17, 49]:
+        single = lookup.find_associations(ra[ii], dec[ii], mode='pulsar')[0]
+        assert nearest[ii]['name'] == single[3] and abs(nearest[ii]['sep']/3600 - single[2]) < 1e-9
+
+    chunked = lookup.find_associations_batch(ra, dec, mode='pulsar', workers=3, chunksize=7)
+    for name in ['cand', 'index', 'sep', 'name', 'dm']:
+        assert np.array_equal(chunked[name], associations[name])
+    assert lookup.find_associations_batch(ra, dec, mode='both') is None
+
+
+def test_pulsar_score():
+    tab, cataloga = lookup.load_atnf()
+    ra, dec, dm = cataloga.ra.deg[:50], cataloga.dec.deg[:50] + 20/3600, np.asarray(tab['DM'][:50])
+    veto, best = lookup.pulsar_veto(ra, dec, dm)
+    assert veto.all() and (best['score'] > 0.9).all() and (abs(best['ddm']) < 1).all()  # 47 Tuc pulsars overlap
+
+    veto, best = lookup.pulsar_veto(ra, dec, dm + 500)
+    assert not veto.any()
+    veto, best = lookup.pulsar_veto([ra[0], 0.], [dec[0], -89.], [dm[0], 100.])
+    assert list(veto) == [True, False] and best['index'][1] == -1
+
+    association = lookup.find_associations(ra[3], dec[3], mode='pulsar', dm=dm[3])[0]
+    assert association[3] == tab['PSRJ'][3] and association[5] > 0.9
+    assert lookup.find_associations(ra[3], dec[3], mode='pulsar', dm=dm[3] + 500) == []
+
+
+def test_cross_match():
+    tab, cataloga = lookup.load_atnf()
+    ra, dec = cataloga.ra.deg[:20], cataloga.dec.deg[:20] + 30/3600
+    repeaters = lookup.SkyIndex([100., 200.], [-30 + 100/3600, 40.],
+                                columns={'name': np.array(['FRB20180916B', 'FRB20121102A']), 'dm': np.array([349., 557.])})
+    lookup.register_catalog('repeaters', repeaters, radius=120, select=lambda catalog, ind: catalog.column('dm', ind) < 500)
+    try:
+        assert 'repeaters' in lookup.registered_catalogs()
+        ras, decs = np.append(ra, [100., 200.]), np.append(dec, [-30., 40.])
+        matches = lookup.cross_match(ras, decs)
+        frbs = matches[matches['catalog'] == 'repeaters']
+        assert list(frbs['cand']) == [20] and frbs[0]['name'] == 'FRB20180916B'  # second repeater fails select
+        atnf = matches[matches['catalog'] == 'atnf']
+        expected = lookup.query_atnf(ra, dec, atnf_radius=60)
+        assert list(atnf['name']) == list(expected['name'])
+        assert set(lookup.cross_match(ras, decs, catalogs=['repeaters'], workers=2, chunksize=5)['catalog']) == {'repeaters'}
+        assert len(lookup.shared_index(['repeaters']).xyz) == 1  # rows failing select are not indexed
+    finally:
+        lookup.unregister_catalog('repeaters')
+    assert 'repeaters' not in lookup.registered_catalogs()
@@ -0,0 +1,26 @@
+import pytest
+import json
+import shutil
+from os import path
+from event import event, migrate
+
+_install_dir = path.abspath(path.dirname(event.__file__))
+
+
+def test_migrate(tmp_path):
+    shutil.copy(f"{_install_dir}/data/t2trigger0.json", tmp_path / "old.json")
+    shutil.copy(f"{_install_dir}/data/t2trigger.json", tmp_path / "new.json")
+    (tmp_path / "bad.json").write_text('[]')
+    fns = sorted(tmp_path.glob('*.json'))
+
+    results = migrate.migrate(fns, dry_run=True)
+    assert migrate.summary(results) == {'legacy': 1, 'unversioned': 1, 'error': 1}
+    assert 'schema_version' not in json.loads((tmp_path / "new.json").read_text())
+
+    results = migrate.migrate(fns, workers=2, chunksize=1)
+    assert migrate.summary(results) == {'legacy': 1, 'unversioned': 1, 'error': 1}
+    assert migrate.summary(migrate.migrate(fns)) == {'current': 2, 'error': 1}
+
+    dd = json.loads((tmp_path / "old.json").read_text())
+    assert dd['trigname'] == '210810aaaa' and dd['schema_version'] == event.SCHEMA_VERSION
+    assert event.create_event(tmp_path / "old.json").gulp == 1
@@ -21,3 +21,49 @@ def test_increment():
     name2 = names.increment_name(mjd, lastname=name)
 
     assert name != name2
+
+def test_yymmdd():
+    for mjd in [59436.59969748689, 51544.0, 60000.99]:
+        dt = time.Time(mjd, format='mjd').to_datetime()
+        assert names.mjd_to_yymmdd(mjd) == dt.strftime('%y%m%d')
+
+
+def test_allocator(tmp_path):
+    mjd = 59436.5
+    allocator = names.NameAllocator(statedir=tmp_path)
+    allocator2 = names.NameAllocator(statedir=tmp_path)  # as in another process
+
+    allocator.reserve('210810aaaa_inj')
+    allocated = [allocator.allocate(mjd) for _ in range(500)] + [allocator2.allocate(mjd) for _ in range(500)]
+    assert len(set(allocated + ['210810aaaa'])) == 1001
+    assert all([name.startswith('210810') and len(name) == 10 for name in allocated])
+    assert names.increment_name(mjd, lastname='210810abcd', allocator=allocator) not in allocated
+
+
+def test_lastname_cache(tmp_path):
+    backend = names.MemoryBackend({names.TRIGGER_KEY: {'210810aaaa': {'mjds': 59436.5}}})
+    cache = names.LastNameCache(backend=backend)
+    assert names.get_lastname(cache=cache) == '210810aaaa'
+    backend.put(names.TRIGGER_KEY, {'210810abcd': {'mjds': 59436.6}})
+    assert names.get_lastname(cache=cache) == '210810abcd'
+
+    backend = names.FileBackend(tmp_path / 'etcd.json')
+    cache = names.LastNameCache(backend=backend)
+    assert cache.get() is None
+    backend.put(names.TRIGGER_KEY, {'210810aaab': {}})
+    assert cache.get() == '210810aaab'
+
+
+def test_vectorized_codec():
+    suffixes = ['aaaa', 'aaab', 'abcd', 'zzzz']
+    numbers = names.suffixes_to_numbers(suffixes)
+    assert list(numbers) == [names.suffixtonumber(suffix) for suffix in suffixes]
+    assert list(names.numbers_to_suffixes(numbers)) == suffixes
+
+
+def test_name_index():
+    idx = names.NameIndex(['210810abcd', '210810abcd_inj', '210809zzzz', '210811aaaa', '210810abcd'])
+    assert len(idx) == 4
+    assert list(idx.day('210810')) == ['210810abcd', '210810abcd_inj']
+    assert list(idx.range(210809, 210810)) == ['210809zzzz', '210810abcd', '210810abcd_inj']
+    assert '210811aaaa' in idx and '210811aaab' not in idx
@@ -0,0 +1,38 @@
+import numpy as np
+from event import skymask, lookup
+
+
+def test_pixels():
+    for nside in [1, 3, 16]:
+        pix = np.arange(skymask.nside2npix(nside))
+        assert (skymask.ang2pix(nside, *skymask.pix2ang(nside, pix)) == pix).all()
+    ra, dec = skymask.pix2ang(1, [0, 4])
+    assert np.allclose(ra, [45, 0]) and np.allclose(dec, [np.degrees(np.arcsin(2/3)), 0])
+
+
+def test_skymask(tmp_path):
+    outpath = skymask.build_skymask(tmp_path / 'mask', nside=256, atnf_radius=120)
+    mask = skymask.load_skymask(outpath)
+    assert mask.mode == 'pulsar' and skymask.load_skymask(outpath) is mask
+
+    tab, cataloga = lookup.load_atnf()
+    ra, dec = cataloga.ra.deg[:100], cataloga.dec.deg[:100] + 100/3600
+    assert mask.flagged(ra, dec).all()
+    assert mask.check(ra[0], dec[0])[0][3] == tab['PSRJ'][0]
+    assert mask.check(0., -89.) == []
+
+    associations = mask.check_batch(np.append(ra, 0.), np.append(dec, -89.))
+    assert set(associations['cand']) == set(range(100))
+
+    assert skymask.build_skymask(outpath, nside=16) == outpath  # old bitmap stays mapped by mask
+    assert mask.flagged(ra, dec).all()
+    assert skymask.load_skymask(outpath).nside == 16
+
+
+def test_scalar_pixels():
+    rng = np.random.default_rng(0)
+    ra, dec = rng.uniform(0, 360, 1000), np.degrees(np.arcsin(rng.uniform(-1, 1, 1000)))
+    for nside in [1, 64, 1024]:
+        pix = skymask.ang2pix(nside, ra, dec)
+        assert all(skymask._zphi2pix_scalar(nside, np.sin(np.radians(d)), np.radians(r)) == p
+                   for r, d, p in zip(ra, dec, pix))
@@ -0,0 +1,38 @@
+import pytest
+from os import path
+from event import event, table
+
+_install_dir = path.abspath(path.dirname(event.__file__))
+
+
+def test_roundtrip():
+    dd = event.create_event(f"{_install_dir}/data/t2trigger.json")
+    dd2 = event.create_event(f"{_install_dir}/data/t2trigger0.json")
+    dd2.label = 'rfi'
+    dd2.corr03_data = 'data.out'
+
+    tab = table.EventTable.from_events([dd, dd2])
+    assert len(tab) == 2
+    assert tab.to_events() == [dd, dd2]
+
+
+def test_voltage_flags():
+    dd = event.create_event(f"{_install_dir}/data/t2trigger.json")
+    dd.corr03_data, dd.corr03_header = True, True  # as written by labels.check_voltages
+    dd2 = event.create_event(f"{_install_dir}/data/t2trigger0.json")
+    dd2.corr03_data = 'data.out'
+
+    tab = table.EventTable.from_events([dd, dd2])
+    assert tab['corr03_data'].tolist() == [True, 'data.out']
+    assert tab.to_events() == [dd, dd2]
+    assert tab.to_events()[0].corr03_header is True
+
+
+def test_select():
+    tab = table.EventTable.from_dir(f"{_install_dir}/data", pattern="t2trigger*.json")
+    assert len(tab) == 2
+
+    sel = tab[(tab['snr'] > 9) & (tab['dm'] > 20) & (tab['dm'] < 30) & tab.isnull('label')]
+    assert len(sel) == 2
+    assert len(tab[tab['snr'] > 10]) == 0
+    assert tab['label'].mask.all()